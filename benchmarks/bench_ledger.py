@@ -0,0 +1,169 @@
+"""Memory and report latency: list of sale dicts vs. the columnar SalesLedger.
+
+    python benchmarks/bench_ledger.py                 # 10k, 100k and 1M sales
+    python benchmarks/bench_ledger.py --sizes 10000   # quicker run
+    python benchmarks/bench_ledger.py --db            # also time Database.load_ledger and By Product
+
+With --db each size is also written to a scratch Database, then timed as the
+Reports page's By Product view runs it: the first load_ledger straight from
+the sales/sale_items cursors, the reload after one more sale (which appends
+just that sale), then group_totals("product").
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from engine import Database  # noqa: E402
+from engine.ledger import SalesLedger  # noqa: E402
+
+STORES = ["1 E Penn Sq", "5600 Germantown Ave", "2644 Germantown Ave"]
+EMPLOYEES = [f"Employee {i}" for i in range(12)]
+PRODUCTS = [f"Phone model {i}" for i in range(150)] + [f"Accessory {i}" for i in range(150)]
+
+
+def make_sales(count, seed=7):
+    rng = random.Random(seed)
+    sales = []
+    for _ in range(count):
+        products = []
+        for name in rng.sample(PRODUCTS, rng.randint(1, 3)):
+            qty = rng.randint(1, 3)
+            cost = round(rng.uniform(5, 300), 2) * qty
+            products.append({"name": name, "quantity": qty, "cost": cost, "sold": round(cost * 1.3, 2)})
+        cost = sum(p["cost"] for p in products)
+        sold = sum(p["sold"] for p in products)
+        sales.append({
+            "employee": rng.choice(EMPLOYEES),
+            "store": rng.choice(STORES),
+            "date": f"{rng.randint(1, 12):02d}/{rng.randint(1, 28):02d}/2025 {rng.randint(9, 20):02d}:{rng.randint(0, 59):02d}",
+            "type": "Phone Sale",
+            "products": products,
+            "cost": cost,
+            "sold": sold,
+            "acc": sold - cost,
+            "payment_method": rng.choice(["Cash", "Card"]),
+        })
+    return sales
+
+
+# ---------- The list-of-dicts report this replaces ----------
+def dict_totals(sales):
+    return {
+        "cost": sum(s["cost"] for s in sales),
+        "sold": sum(s["sold"] for s in sales),
+        "acc": sum(s["acc"] for s in sales),
+        "cash": sum(s["sold"] for s in sales if s["payment_method"] == "Cash"),
+        "card": sum(s["sold"] for s in sales if s["payment_method"] == "Card")
+    }
+
+
+def dict_report(sales):
+    # "All Stores" plus one "By Store" and one "By Employee" report per key
+    report = {"all": dict_totals(sales)}
+    for store in STORES:
+        report[store] = dict_totals([s for s in sales if s["store"] == store])
+    for employee in EMPLOYEES:
+        report[employee] = dict_totals([s for s in sales if s["employee"] == employee])
+    return report
+
+
+def ledger_report(ledger):
+    return {
+        "all": ledger.totals(),
+        "store": ledger.group_totals("store"),
+        "employee": ledger.group_totals("employee"),
+    }
+
+
+def traced(build):
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def best_of(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def db_run(sales, repeat):
+    with tempfile.TemporaryDirectory() as scratch:
+        db = Database(os.path.join(scratch, "ledger.db"), summaries=False)
+        try:
+            for first in range(0, len(sales), 10000):
+                db.add_sales(sales[first:first + 10000])
+            started = time.perf_counter()
+            db.load_ledger()
+            build_seconds = time.perf_counter() - started
+            reloads = []
+            for sale in sales[:repeat]:
+                db.add_sale({key: value for key, value in sale.items() if key != "uid"})
+                started = time.perf_counter()
+                ledger = db.load_ledger()
+                reloads.append(time.perf_counter() - started)
+            product_seconds = best_of(lambda: ledger.group_totals("product"), repeat)
+        finally:
+            db.close()
+    units = sum(item["quantity"] for sale in sales + sales[:repeat] for item in sale["products"])
+    assert sum(group["quantity"] for group in ledger.group_totals("product").values()) == units
+    return {
+        "load_ledger ms": build_seconds * 1000,
+        "after sale ms": min(reloads) * 1000,
+        "by product ms": product_seconds * 1000,
+    }
+
+
+def run(size, repeat, with_db):
+    sales, dict_bytes = traced(lambda: make_sales(size))
+    ledger, ledger_bytes = traced(lambda: SalesLedger.from_sales(sales))
+
+    expected = dict_totals(sales)
+    actual = ledger.totals()
+    assert all(abs(expected[k] - actual[k]) < 1e-6 * max(1.0, abs(expected[k])) for k in expected)
+
+    dict_seconds = best_of(lambda: dict_report(sales), repeat)
+    ledger_seconds = best_of(lambda: ledger_report(ledger), repeat)
+    row = {
+        "sales": size,
+        "dict B/sale": dict_bytes / size,
+        "ledger B/sale": ledger_bytes / size,
+        "dict report ms": dict_seconds * 1000,
+        "ledger report ms": ledger_seconds * 1000,
+        "speedup": dict_seconds / ledger_seconds,
+    }
+    if with_db:
+        row.update(db_run(sales, repeat))
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--db", action="store_true", help="also time the database-to-ledger path")
+    args = parser.parse_args()
+
+    columns = ["sales", "dict B/sale", "ledger B/sale", "dict report ms", "ledger report ms", "speedup"]
+    if args.db:
+        columns += ["load_ledger ms", "after sale ms", "by product ms"]
+    print(" | ".join(f"{c:>16}" for c in columns))
+    for size in (int(s) for s in args.sizes.split(",")):
+        row = run(size, args.repeat, args.db)
+        print(" | ".join(f"{row[c]:>16,.1f}" if isinstance(row[c], float) else f"{row[c]:>16,}" for c in columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""Load test: concurrent registers checking out, restocking and running reports.
+
+    python benchmarks/bench_load.py                              # 1k, 10k and 100k sales, 9 registers
+    python benchmarks/bench_load.py --sizes 1000000 --registers 12 --ops 500
+    python benchmarks/bench_load.py --sizes 10000 --max-p99-ms 50   # exit 1 if any p99 is slower
+
+Each size seeds a fresh database with that many historical sales, then starts
+one thread per register. Registers are spread over the stores and each runs
+a mix of Add Sale checkouts, Inventory restocks and Reports reads against the
+shared Database, as the app's sessions do.
+"""
+
+import argparse
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_ledger import PRODUCTS, STORES, make_sales  # noqa: E402
+from engine import Database  # noqa: E402
+from engine.dates import DATE_FORMAT  # noqa: E402
+
+# Share of register operations per flow
+MIX = {"checkout": 0.7, "restock": 0.1, "report": 0.2}
+SEED_CHUNK = 10000
+
+
+def seed(db, size):
+    db.bulk_import({
+        (store, product): {"qty": 10 ** 7, "cost": round(random.Random(product).uniform(5, 300), 2)}
+        for store in STORES for product in PRODUCTS
+    })
+    started = time.perf_counter()
+    for first in range(0, size, SEED_CHUNK):
+        db.add_sales(make_sales(min(SEED_CHUNK, size - first), seed=first))
+    db.compact_summaries()
+    return time.perf_counter() - started
+
+
+def checkout(db, rng, store, employee):
+    products = []
+    for name in rng.sample(PRODUCTS, rng.randint(1, 3)):
+        qty = rng.randint(1, 2)
+        cost = round(rng.uniform(5, 300), 2) * qty
+        products.append({"name": name, "quantity": qty, "cost": cost, "sold": round(cost * 1.3, 2)})
+    cost = sum(p["cost"] for p in products)
+    sold = sum(p["sold"] for p in products)
+    db.checkout({
+        "employee": employee,
+        "store": store,
+        "date": datetime.now().strftime(DATE_FORMAT),
+        "type": "Phone Sale",
+        "products": products,
+        "cost": cost,
+        "sold": sold,
+        "acc": sold - cost,
+        "payment_method": rng.choice(["Cash", "Card"]),
+    })
+
+
+def restock(db, rng, store, employee):
+    db.add_stock(store, rng.choice(PRODUCTS), rng.randint(1, 10))
+
+
+def report(db, rng, store, employee):
+    # What the Reports page reads: period totals, the first table page and a monthly comparison
+    today = date.today()
+    db.range_totals(today - timedelta(days=30), today + timedelta(days=1), "store", store)
+    db.query_sales(store, order_by="ts", descending=True, limit=25)
+    db.bucket_totals(today - timedelta(days=365), today + timedelta(days=1), "month")
+
+
+FLOWS = {"checkout": checkout, "restock": restock, "report": report}
+
+
+def register(db, number, ops, start, latencies):
+    rng = random.Random(number)
+    store = STORES[number % len(STORES)]
+    employee = f"Register {number}"
+    kinds = list(MIX)
+    weights = list(MIX.values())
+    timings = {kind: [] for kind in kinds}
+    start.wait()
+    for _ in range(ops):
+        kind = rng.choices(kinds, weights)[0]
+        began = time.perf_counter()
+        FLOWS[kind](db, rng, store, employee)
+        timings[kind].append(time.perf_counter() - began)
+    latencies.append(timings)
+
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def run(size, registers, ops, journal):
+    with tempfile.TemporaryDirectory() as scratch:
+        path = os.path.join(scratch, "load.db")
+        db = Database(path, pool_size=registers, journal_dir=os.path.join(scratch, "journal") if journal else None)
+        try:
+            seed_seconds = seed(db, size)
+            latencies = []
+            start = threading.Barrier(registers + 1)
+            threads = [
+                threading.Thread(target=register, args=(db, number, ops, start, latencies))
+                for number in range(registers)
+            ]
+            for thread in threads:
+                thread.start()
+            start.wait()
+            began = time.perf_counter()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - began
+            db_bytes = os.path.getsize(path)
+        finally:
+            db.close()
+
+    rows = []
+    for kind in MIX:
+        values = sorted(value for timings in latencies for value in timings[kind])
+        if values:
+            rows.append({
+                "sales": size,
+                "flow": kind,
+                "ops": len(values),
+                "p50 ms": percentile(values, 0.50) * 1000,
+                "p99 ms": percentile(values, 0.99) * 1000,
+                "max ms": values[-1] * 1000,
+            })
+    summary = {
+        "sales": size,
+        "seed sales/s": size / seed_seconds if seed_seconds else 0.0,
+        "ops/s": registers * ops / elapsed,
+        "peak RSS MB": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "db MB": db_bytes / 2 ** 20,
+    }
+    return rows, summary
+
+
+def print_table(rows, columns):
+    print(" | ".join(f"{c:>14}" for c in columns))
+    for row in rows:
+        print(" | ".join(
+            f"{row[c]:>14,.2f}" if isinstance(row[c], float) else f"{row[c]:>14,}" if isinstance(row[c], int)
+            else f"{row[c]:>14}" for c in columns
+        ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--registers", type=int, default=9, help="concurrent registers (default: 3 per store)")
+    parser.add_argument("--ops", type=int, default=200, help="operations per register")
+    parser.add_argument("--journal", action="store_true", help="journal every write, as the app does")
+    parser.add_argument("--max-p99-ms", type=float, help="exit with status 1 if any flow's p99 is slower")
+    args = parser.parse_args()
+
+    slow = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        rows, summary = run(size, args.registers, args.ops, args.journal)
+        print_table(rows, ["sales", "flow", "ops", "p50 ms", "p99 ms", "max ms"])
+        print_table([summary], list(summary))
+        print()
+        if args.max_p99_ms is not None:
+            slow += [row for row in rows if row["p99 ms"] > args.max_p99_ms]
+
+    if slow:
+        for row in slow:
+            print(f"p99 over {args.max_p99_ms} ms: {row['flow']} at {row['sales']:,} sales ({row['p99 ms']:.1f} ms)")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
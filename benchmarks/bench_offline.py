@@ -0,0 +1,206 @@
+"""Offline registers: checkout latency and sync correctness over a flaky link.
+
+    python benchmarks/bench_offline.py                         # 6 registers, 50 ms link, outages
+    python benchmarks/bench_offline.py --latency-ms 200 --ops 500 --lose 0.2
+
+The central Database sits behind FlakyLink, a local stand-in for the network:
+every call waits the link latency, fails while an outage is on, and with
+probability --lose loses its reply after the central store has applied it.
+Each register checks out the same mix twice, once directly over the link and
+once through an OfflineRegister, and after the link recovers the queues are
+drained and checked: every queued sale is recorded exactly once or held as an
+oversold conflict, and no stock is negative.
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_ledger import PRODUCTS, STORES  # noqa: E402
+from bench_load import percentile, print_table  # noqa: E402
+from engine import Database, OfflineRegister, StockError  # noqa: E402
+from engine.dates import DATE_FORMAT  # noqa: E402
+
+# A few units of this one, so registers that sold it offline collide
+SCARCE = "Phone model 0"
+SCARCE_QTY = 5
+
+
+class FlakyLink:
+    """Forwards method calls to the central Database like a remote client would."""
+
+    def __init__(self, central, latency, lose, seed=0):
+        self.central = central
+        self.latency = latency
+        self.lose = lose
+        self.down = threading.Event()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        method = getattr(self.central, name)
+
+        def call(*args):
+            time.sleep(self.latency)
+            if self.down.is_set():
+                raise ConnectionError("link down")
+            result = method(*args)
+            with self._lock:
+                lost = self._rng.random() < self.lose
+            if lost:
+                raise ConnectionError("reply lost")
+            return result
+
+        return call
+
+
+def make_sale(rng, store, employee):
+    products = []
+    for name in rng.sample(PRODUCTS, rng.randint(1, 3)):
+        qty = rng.randint(1, 2)
+        cost = round(rng.uniform(5, 300), 2) * qty
+        products.append({"name": name, "quantity": qty, "cost": cost, "sold": round(cost * 1.3, 2)})
+    cost = sum(p["cost"] for p in products)
+    sold = sum(p["sold"] for p in products)
+    return {
+        "employee": employee,
+        "store": store,
+        "date": datetime.now().strftime(DATE_FORMAT),
+        "type": "Phone Sale",
+        "products": products,
+        "cost": cost,
+        "sold": sold,
+        "acc": sold - cost,
+        "payment_method": rng.choice(["Cash", "Card"]),
+    }
+
+
+def outages(link, stop, up_seconds, down_seconds):
+    while not stop.wait(up_seconds):
+        link.down.set()
+        stop.wait(down_seconds)
+        link.down.clear()
+
+
+def run_register(checkout, number, ops, start, timings, failures):
+    rng = random.Random(number)
+    store = STORES[number % len(STORES)]
+    start.wait()
+    for _ in range(ops):
+        sale = make_sale(rng, store, f"Register {number}")
+        if rng.random() < 0.1:
+            sale["products"][0]["name"] = SCARCE
+        began = time.perf_counter()
+        try:
+            checkout(number, sale)
+        except (ConnectionError, StockError):
+            failures.append(number)
+        timings.append(time.perf_counter() - began)
+
+
+def run(mode, registers, ops, latency, lose, up_seconds, down_seconds):
+    with tempfile.TemporaryDirectory() as scratch:
+        central = Database(os.path.join(scratch, "central.db"), pool_size=registers, summaries=False)
+        central.bulk_import({
+            (store, product): {"qty": SCARCE_QTY if product == SCARCE else 10 ** 6, "cost": 10.0}
+            for store in STORES for product in PRODUCTS
+        })
+        link = FlakyLink(central, latency, lose)
+        queues = []
+        if mode == "offline":
+            queues = [
+                OfflineRegister(link, os.path.join(scratch, f"register{n}.db"), STORES, sync_interval=0.05)
+                for n in range(registers)
+            ]
+            for queue in queues:
+                queue.sync()
+
+            def checkout(number, sale):
+                queues[number].checkout(sale)
+        else:
+            def checkout(number, sale):
+                link.checkout(sale)
+
+        timings, failures = [], []
+        start = threading.Barrier(registers + 1)
+        stop = threading.Event()
+        chaos = threading.Thread(target=outages, args=(link, stop, up_seconds, down_seconds))
+        threads = [
+            threading.Thread(target=run_register, args=(checkout, n, ops, start, timings, failures))
+            for n in range(registers)
+        ]
+        for thread in threads:
+            thread.start()
+        start.wait()
+        chaos.start()
+        began = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - began
+        stop.set()
+        chaos.join()
+        link.down.clear()
+
+        # Drain every queue over the recovered (still lossy) link
+        drain_began = time.perf_counter()
+        while any(queue.status()["pending"] for queue in queues):
+            for queue in queues:
+                queue.sync()
+        drain = time.perf_counter() - drain_began
+
+        conflicts = sum(len(queue.conflicts()) for queue in queues)
+        recorded = central.count_sales()
+        uids = {sale["uid"] for sale in central.query_sales()}
+        negative = [
+            (store, product) for store in STORES
+            for product, qty in central.store_inventory(store).items() if qty < 0
+        ]
+        for queue in queues:
+            queue.close()
+        central.close()
+
+    # Every sale accepted offline is either recorded once or held as a conflict
+    accounted = mode == "direct" or recorded + conflicts == len(timings) - len(failures)
+    timings.sort()
+    return {
+        "mode": mode,
+        "checkouts": len(timings),
+        "failed": len(failures),
+        "p50 ms": percentile(timings, 0.50) * 1000,
+        "p99 ms": percentile(timings, 0.99) * 1000,
+        "ops/s": len(timings) / elapsed,
+        "recorded": recorded,
+        "conflicts": conflicts,
+        "drain s": drain,
+        "consistent": "yes" if accounted and len(uids) == recorded and not negative else "NO",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--registers", type=int, default=6)
+    parser.add_argument("--ops", type=int, default=200, help="checkouts per register")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="round trip of every call over the link")
+    parser.add_argument("--lose", type=float, default=0.05, help="share of replies lost after the call applied")
+    parser.add_argument("--up", type=float, default=1.0, help="seconds between outages")
+    parser.add_argument("--down", type=float, default=1.0, help="seconds each outage lasts")
+    args = parser.parse_args()
+
+    rows = [
+        run(mode, args.registers, args.ops, args.latency_ms / 1000, args.lose, args.up, args.down)
+        for mode in ("direct", "offline")
+    ]
+    print_table(rows, list(rows[0]))
+    if any(row["consistent"] != "yes" for row in rows):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+"""Sales & inventory engine for the Total Wireless app, independent of the UI.
+
+Database is the storage layer and OfflineRegister a register-side queue in
+front of it for when the link drops; records, checkout, inventory and reports
+hold the typed Sale/LineItem records and the pure business rules around them.
+"""
+
+from .changes import CATALOG, CLOSES, INVENTORY, PRODUCTS, SALES, ChangeFeed
+from .db import CatalogError, Database
+from .inventory import StockError
+from .records import LineItem, Sale
+from .register import OfflineRegister
+
+__all__ = [
+    "CATALOG", "CLOSES", "INVENTORY", "PRODUCTS", "SALES",
+    "CatalogError", "ChangeFeed", "Database", "LineItem", "OfflineRegister", "Sale", "StockError",
+]
@@ -0,0 +1,142 @@
+"""Bulk inventory import from CSV/XLSX and streaming CSV export of sales.
+
+Imports are read and validated row by row and folded into one entry per
+(store, product), so memory grows with the number of distinct SKUs rather
+than the size of the file. The result is applied by Database.bulk_import as
+a single transaction.
+"""
+
+import csv
+import io
+import math
+
+IMPORT_COLUMNS = ("store", "product", "qty", "cost")
+# Columns a file must have; cost may be left out to keep current costs
+REQUIRED_COLUMNS = ("store", "product", "qty")
+
+EXPORT_COLUMNS = (
+    "uid", "date", "store", "employee", "type", "payment_method",
+    "product", "quantity", "item_cost", "item_sold", "sale_cost", "sale_sold", "sale_profit",
+)
+
+
+class ImportResult:
+    def __init__(self):
+        self.items = {}  # (store, product) -> {"qty": int, "cost": float or None}
+        self.rows = 0
+        self.errors = []  # (row number, message)
+
+    @property
+    def ok(self):
+        return not self.errors
+
+
+def iter_upload_rows(upload, filename):
+    # Yields one dict per data row, keyed by lower-cased header names
+    if filename.lower().endswith((".xlsx", ".xlsm")):
+        yield from _iter_xlsx_rows(upload)
+    else:
+        text = io.TextIOWrapper(upload, encoding="utf-8-sig", newline="")
+        for row in csv.DictReader(text):
+            yield {(key or "").strip().lower(): value for key, value in row.items()}
+
+
+def _iter_xlsx_rows(upload):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ImportError("Excel import needs the 'openpyxl' package; upload a CSV instead.")
+    workbook = load_workbook(upload, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(cell or "").strip().lower() for cell in next(rows, ())]
+        for cells in rows:
+            yield {key: "" if cell is None else str(cell) for key, cell in zip(header, cells)}
+    finally:
+        workbook.close()
+
+
+def _numbered(rows, result):
+    # (row number, row) pairs; a CSV that is not UTF-8 stops with a row error
+    # rather than an exception (decoding runs in chunks, so the number is where
+    # the undecodable chunk starts)
+    rows = iter(rows)
+    number = 1  # row 1 is the header
+    while True:
+        number += 1
+        try:
+            row = next(rows)
+        except StopIteration:
+            return
+        except UnicodeDecodeError:
+            result.errors.append((number, "the file is not UTF-8 text; save it as CSV (UTF-8) and upload it again"))
+            return
+        yield number, row
+
+
+def parse_inventory(rows, stores, priced=(), max_errors=50):
+    # Validates each row and merges duplicates: quantities add up, the last
+    # cost given for a product wins. A blank cost leaves the current cost alone,
+    # so it is only allowed for the (store, product) pairs in `priced`: a
+    # product Add Sale can offer needs a cost price in its store.
+    result = ImportResult()
+    first_rows = {}
+    for number, row in _numbered(rows, result):
+        if number == 2:
+            missing = [column for column in REQUIRED_COLUMNS if column not in row]
+            if missing:
+                result.errors.append((1, f"missing column(s): {', '.join(missing)}"))
+                break
+        result.rows += 1
+        store = (row.get("store") or "").strip()
+        product = (row.get("product") or "").strip()
+        try:
+            qty = float((row.get("qty") or "").strip() or 0)
+            cost = (row.get("cost") or "").strip()
+            cost = float(cost) if cost else None
+        except (ValueError, OverflowError):
+            result.errors.append((number, "qty and cost must be numbers"))
+        else:
+            if not math.isfinite(qty) or (cost is not None and not math.isfinite(cost)):
+                result.errors.append((number, "qty and cost must be finite numbers"))
+            elif not qty.is_integer():
+                result.errors.append((number, "qty must be a whole number"))
+            elif store not in stores:
+                result.errors.append((number, f"unknown store '{store}'"))
+            elif not product:
+                result.errors.append((number, "product name is empty"))
+            elif qty < 0 or (cost is not None and cost < 0):
+                result.errors.append((number, "qty and cost must not be negative"))
+            else:
+                first_rows.setdefault((store, product), number)
+                item = result.items.setdefault((store, product), {"qty": 0, "cost": None})
+                item["qty"] += int(qty)
+                if cost is not None:
+                    item["cost"] = cost
+        if len(result.errors) >= max_errors:
+            break
+    for key, item in result.items.items():
+        if item["cost"] is None and key not in priced and len(result.errors) < max_errors:
+            result.errors.append((first_rows[key], f"cost is required for '{key[1]}', which {key[0]} has no cost price for"))
+    return result
+
+
+def iter_sales_csv(rows, chunk_rows=1000):
+    # Turns joined sale/line-item rows into CSV text, one chunk per chunk_rows lines
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    pending = 0
+    for row in rows:
+        writer.writerow([
+            row["uid"], row["date"], row["store"], row["employee"], row["type"], row["payment_method"],
+            row["name"], row["quantity"], row["item_cost"], row["item_sold"],
+            row["cost"], row["sold"], row["acc"],
+        ])
+        pending += 1
+        if pending >= chunk_rows:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue()
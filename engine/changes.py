@@ -0,0 +1,72 @@
+import threading
+from collections import defaultdict
+
+# Topics a write can touch
+SALES = "sales"
+INVENTORY = "inventory"
+PRODUCTS = "products"
+CLOSES = "closes"
+CATALOG = "catalog"  # SKU names across all stores: one added or renamed
+
+
+class ChangeFeed:
+    """Version counters per (topic, store), bumped after each committed write.
+
+    Readers compare versions to decide whether their copy of a store's data is
+    stale; subscribers are called with (topic, store) for push-style updates.
+    A store of None means the whole topic changed (e.g. an admin reset).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions = defaultdict(int)
+        self._subscribers = []
+
+    def publish(self, topic, *stores):
+        with self._lock:
+            for store in stores:
+                self._versions[(topic, store)] += 1
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            for store in stores:
+                callback(topic, store)
+
+    def version(self, topic, store=None):
+        # A topic-wide change counts against every store
+        with self._lock:
+            if store is None:
+                return sum(v for (t, _), v in self._versions.items() if t == topic)
+            return self._versions[(topic, store)] + self._versions[(topic, None)]
+
+    def subscribe(self, callback):
+        with self._lock:
+            self._subscribers.append(callback)
+
+        def unsubscribe():
+            with self._lock:
+                self._subscribers.remove(callback)
+
+        return unsubscribe
+
+
+class VersionedCache:
+    """Process-wide cache of per-store reads, reloaded only when that store changes."""
+
+    def __init__(self, changes):
+        self._changes = changes
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, topic, store, loader, key=None):
+        # The version is read before loading, so a write racing with the load
+        # just causes one more reload next time rather than a stale hit.
+        # Values are shared between sessions and must not be mutated.
+        version = self._changes.version(topic, store)
+        with self._lock:
+            hit = self._entries.get((topic, store, key))
+        if hit is not None and hit[0] == version:
+            return hit[1]
+        value = loader()
+        with self._lock:
+            self._entries[(topic, store, key)] = (version, value)
+        return value
@@ -0,0 +1,39 @@
+"""Building and validating sales; pure functions with no storage or UI."""
+
+from datetime import datetime
+
+from .dates import DATE_FORMAT
+from .records import LineItem, Sale
+
+
+def line_item(name, quantity, unit_cost, unit_sold):
+    return LineItem(name, quantity, unit_cost * quantity, unit_sold * quantity)
+
+
+def build_sale(employee, store, sale_type, items, payment_method, when=None):
+    # Totals always follow the lines; `when` defaults to now
+    items = list(items)
+    cost = sum(item.cost for item in items)
+    sold = sum(item.sold for item in items)
+    return Sale(
+        employee=employee,
+        store=store,
+        date=(when or datetime.now()).strftime(DATE_FORMAT),
+        type=sale_type,
+        products=items,
+        cost=cost,
+        sold=sold,
+        acc=sold - cost,
+        payment_method=payment_method,
+    )
+
+
+def sale_problems(sale):
+    # Messages for every line that cannot be saved; empty when the sale is valid
+    problems = []
+    for item in sale.products:
+        if item.quantity < 1:
+            problems.append(f"Quantity for product '{item.name}' must be at least 1.")
+        if item.cost < 0 or item.sold < 0:
+            problems.append(f"Cost and Sold price must be non-negative for product '{item.name}'.")
+    return problems
@@ -0,0 +1,18 @@
+import calendar
+from datetime import datetime
+
+# Format sales have always been stored and shown in
+DATE_FORMAT = "%m/%d/%Y %H:%M"
+
+
+def to_timestamp(value):
+    # Wall-clock seconds (store local time, no timezone shift) so that ordering
+    # and day boundaries match the dates printed on the sales.
+    if isinstance(value, str):
+        value = datetime.strptime(value, DATE_FORMAT)
+    return calendar.timegm(value.timetuple())
+
+
+def day_key(date):
+    # "%m/%d/%Y %H:%M" -> "YYYY-MM-DD", which sorts chronologically
+    return f"{date[6:10]}-{date[0:2]}-{date[3:5]}"
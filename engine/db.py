@@ -0,0 +1,1048 @@
+import os
+import queue
+import shutil
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+from . import summaries as _summaries
+from . import totals as _totals
+from . import velocity as _velocity
+from .changes import CATALOG, CLOSES, INVENTORY, PRODUCTS, SALES, ChangeFeed, VersionedCache
+from .inventory import UNSTOCKED_ITEMS, StockError, stock_needed
+from .journal import Journal
+from .records import LineItem, Sale
+from .dates import DATE_FORMAT, to_timestamp
+
+# ---------- Schema ----------
+def _backfill_totals(conn):
+    # Fold the sales recorded before sale_totals existed into it, once
+    for row in conn.execute("SELECT * FROM sales").fetchall():
+        _totals.apply_sale(conn, row)
+
+
+def _create_velocity(conn):
+    conn.execute(
+        """
+        CREATE TABLE sku_velocity (
+            store TEXT NOT NULL,
+            sku_id INTEGER NOT NULL REFERENCES skus (id),
+            units REAL NOT NULL,
+            ts INTEGER NOT NULL,
+            PRIMARY KEY (store, sku_id)
+        ) WITHOUT ROWID
+        """
+    )
+    _velocity.backfill(conn, to_timestamp(datetime.now()))
+
+
+# Each entry (SQL script or callable taking the connection) is applied once, in
+# order, inside its own transaction; PRAGMA user_version records how many ran.
+_MIGRATIONS = [
+    """
+    CREATE TABLE sales (
+        id INTEGER PRIMARY KEY,
+        employee TEXT NOT NULL,
+        store TEXT NOT NULL,
+        date TEXT NOT NULL,
+        type TEXT NOT NULL,
+        cost REAL NOT NULL,
+        sold REAL NOT NULL,
+        acc REAL NOT NULL,
+        payment_method TEXT NOT NULL
+    );
+    CREATE INDEX sales_store ON sales (store);
+    CREATE INDEX sales_employee ON sales (employee);
+
+    CREATE TABLE sale_items (
+        sale_id INTEGER NOT NULL REFERENCES sales (id) ON DELETE CASCADE,
+        pos INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        quantity INTEGER NOT NULL,
+        cost REAL NOT NULL,
+        sold REAL NOT NULL,
+        PRIMARY KEY (sale_id, pos)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE inventory (
+        store TEXT NOT NULL,
+        product TEXT NOT NULL,
+        qty INTEGER NOT NULL,
+        PRIMARY KEY (store, product)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE products (
+        store TEXT NOT NULL,
+        product TEXT NOT NULL,
+        cost REAL NOT NULL,
+        PRIMARY KEY (store, product)
+    ) WITHOUT ROWID;
+    """,
+    """
+    CREATE TABLE sale_totals (
+        dim TEXT NOT NULL,
+        key TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        cost REAL NOT NULL,
+        sold REAL NOT NULL,
+        acc REAL NOT NULL,
+        cash REAL NOT NULL,
+        card REAL NOT NULL,
+        PRIMARY KEY (dim, key)
+    ) WITHOUT ROWID;
+    """,
+    _backfill_totals,
+    """
+    ALTER TABLE sales ADD COLUMN ts INTEGER NOT NULL DEFAULT 0;
+    UPDATE sales SET ts = CAST(strftime('%s',
+        substr(date, 7, 4) || '-' || substr(date, 1, 2) || '-' || substr(date, 4, 2)
+        || ' ' || substr(date, 12, 5)) AS INTEGER);
+    DROP INDEX sales_store;
+    DROP INDEX sales_employee;
+    CREATE INDEX sales_ts ON sales (ts);
+    CREATE INDEX sales_store_ts ON sales (store, ts);
+    CREATE INDEX sales_employee_ts ON sales (employee, ts);
+    """,
+    """
+    ALTER TABLE sales ADD COLUMN uid TEXT;
+    UPDATE sales SET uid = lower(hex(randomblob(16)));
+    CREATE UNIQUE INDEX sales_uid ON sales (uid);
+
+    CREATE TABLE meta (
+        key TEXT PRIMARY KEY,
+        value
+    ) WITHOUT ROWID;
+    INSERT INTO meta (key, value) VALUES ('journal_seq', 0);
+    """,
+    # Normalized catalog: one row per SKU, referenced by id everywhere else,
+    # so a rename is a single UPDATE that every view picks up.
+    """
+    CREATE TABLE skus (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE
+    );
+    INSERT INTO skus (name) SELECT product FROM inventory UNION SELECT product FROM products;
+
+    CREATE TABLE inventory_by_sku (
+        store TEXT NOT NULL,
+        sku_id INTEGER NOT NULL REFERENCES skus (id),
+        qty INTEGER NOT NULL,
+        PRIMARY KEY (store, sku_id)
+    ) WITHOUT ROWID;
+    INSERT INTO inventory_by_sku (store, sku_id, qty)
+        SELECT i.store, k.id, i.qty FROM inventory i JOIN skus k ON k.name = i.product;
+    DROP TABLE inventory;
+    ALTER TABLE inventory_by_sku RENAME TO inventory;
+
+    CREATE TABLE products_by_sku (
+        store TEXT NOT NULL,
+        sku_id INTEGER NOT NULL REFERENCES skus (id),
+        cost REAL NOT NULL,
+        PRIMARY KEY (store, sku_id)
+    ) WITHOUT ROWID;
+    INSERT INTO products_by_sku (store, sku_id, cost)
+        SELECT p.store, k.id, p.cost FROM products p JOIN skus k ON k.name = p.product;
+    DROP TABLE products;
+    ALTER TABLE products_by_sku RENAME TO products;
+
+    -- Lines for catalog items point at their SKU; custom items and bill
+    -- payments keep only the name they were sold under.
+    ALTER TABLE sale_items ADD COLUMN sku_id INTEGER REFERENCES skus (id);
+    UPDATE sale_items SET sku_id = (SELECT id FROM skus WHERE name = sale_items.name);
+    CREATE INDEX sale_items_sku ON sale_items (sku_id);
+    """,
+    """
+    CREATE TABLE daily_summaries (
+        day TEXT NOT NULL,
+        dim TEXT NOT NULL,
+        key TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        cost REAL NOT NULL,
+        sold REAL NOT NULL,
+        acc REAL NOT NULL,
+        cash REAL NOT NULL,
+        card REAL NOT NULL,
+        PRIMARY KEY (dim, key, day)
+    ) WITHOUT ROWID;
+    CREATE INDEX daily_summaries_day ON daily_summaries (day);
+    """,
+    """
+    CREATE TABLE day_closes (
+        store TEXT NOT NULL,
+        day TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        cost REAL NOT NULL,
+        sold REAL NOT NULL,
+        acc REAL NOT NULL,
+        cash REAL NOT NULL,
+        card REAL NOT NULL,
+        closed_at TEXT NOT NULL,
+        closed_by TEXT NOT NULL,
+        PRIMARY KEY (store, day)
+    ) WITHOUT ROWID;
+    """,
+    _create_velocity,
+    """
+    -- Product -> stores lookups for cross-store availability
+    CREATE INDEX inventory_sku ON inventory (sku_id);
+
+    CREATE TABLE transfers (
+        id INTEGER PRIMARY KEY,
+        sku_id INTEGER NOT NULL REFERENCES skus (id),
+        from_store TEXT NOT NULL,
+        to_store TEXT NOT NULL,
+        qty INTEGER NOT NULL,
+        moved_at TEXT NOT NULL,
+        moved_by TEXT NOT NULL
+    );
+    CREATE INDEX transfers_from ON transfers (from_store, id);
+    CREATE INDEX transfers_to ON transfers (to_store, id);
+    """,
+]
+
+# Statements are module constants so sqlite3's per-connection statement cache
+# reuses the compiled (prepared) form on every call.
+_INSERT_SALE = (
+    "INSERT INTO sales (uid, employee, store, date, ts, type, cost, sold, acc, payment_method) "
+    "VALUES (:uid, :employee, :store, :date, :ts, :type, :cost, :sold, :acc, :payment_method)"
+)
+_UPDATE_SALE = (
+    "UPDATE sales SET employee = :employee, store = :store, date = :date, ts = :ts, type = :type, "
+    "cost = :cost, sold = :sold, acc = :acc, payment_method = :payment_method WHERE id = :id"
+)
+_INSERT_ITEM = (
+    "INSERT INTO sale_items (sale_id, pos, sku_id, name, quantity, cost, sold) "
+    "VALUES (?1, ?2, (SELECT id FROM skus WHERE name = ?3), ?3, ?4, ?5, ?6)"
+)
+_SELECT_SALE = "SELECT * FROM sales WHERE uid = ?"
+_SELECT_SALES = "SELECT * FROM sales ORDER BY id"
+_SELECT_SALES_AFTER = "SELECT * FROM sales WHERE id > ? ORDER BY id"
+_SELECT_EMPLOYEES = "SELECT key FROM sale_totals WHERE dim = 'employee' AND count > 0 ORDER BY key"
+# Line items show the SKU's current name, so renames reach past sales too
+_SELECT_ITEM_ROWS = (
+    "SELECT i.sale_id, i.pos, i.sku_id, COALESCE(k.name, i.name) AS name, i.quantity, i.cost, i.sold "
+    "FROM sale_items i LEFT JOIN skus k ON k.id = i.sku_id"
+)
+_SELECT_ITEMS = f"{_SELECT_ITEM_ROWS} ORDER BY i.sale_id, i.pos"
+_SELECT_ITEMS_AFTER = f"{_SELECT_ITEM_ROWS} WHERE i.sale_id > ? ORDER BY i.sale_id, i.pos"
+_SELECT_INVENTORY = "SELECT i.store, k.name AS product, i.qty FROM inventory i JOIN skus k ON k.id = i.sku_id"
+_SELECT_STORE_INVENTORY = f"{_SELECT_INVENTORY} WHERE i.store = ? ORDER BY k.name"
+_SELECT_PRODUCTS = "SELECT p.store, k.name AS product, p.cost FROM products p JOIN skus k ON k.id = p.sku_id"
+_SELECT_STORE_PRODUCTS = f"{_SELECT_PRODUCTS} WHERE p.store = ? ORDER BY k.name"
+_SELECT_SKU = "SELECT id FROM skus WHERE name = ?"
+_SELECT_SKU_NAMES = "SELECT name FROM skus ORDER BY name"
+_ADD_SKU = "INSERT OR IGNORE INTO skus (name) VALUES (?)"
+_RENAME_SKU = "UPDATE skus SET name = ? WHERE id = ?"
+# Statements below take product names and resolve them to SKU ids in SQL
+_SELECT_QTY = "SELECT qty FROM inventory WHERE store = ? AND sku_id = (SELECT id FROM skus WHERE name = ?)"
+_UPSERT_STOCK = (
+    "INSERT INTO inventory (store, sku_id, qty) VALUES (?, (SELECT id FROM skus WHERE name = ?), ?) "
+    "ON CONFLICT (store, sku_id) DO UPDATE SET qty = qty + excluded.qty"
+)
+# Conditional decrement: matches no row unless enough stock is left, so two
+# registers racing for the last unit cannot both succeed.
+_TAKE_STOCK = (
+    "UPDATE inventory SET qty = qty - ? "
+    "WHERE store = ? AND sku_id = (SELECT id FROM skus WHERE name = ?) AND qty >= ?"
+)
+_SET_STOCK = (
+    "INSERT INTO inventory (store, sku_id, qty) VALUES (?, (SELECT id FROM skus WHERE name = ?), ?) "
+    "ON CONFLICT (store, sku_id) DO UPDATE SET qty = excluded.qty"
+)
+_SET_COST = (
+    "INSERT INTO products (store, sku_id, cost) VALUES (?, (SELECT id FROM skus WHERE name = ?), ?) "
+    "ON CONFLICT (store, sku_id) DO UPDATE SET cost = excluded.cost"
+)
+_SELECT_COST = "SELECT cost FROM products WHERE store = ? AND sku_id = (SELECT id FROM skus WHERE name = ?)"
+_DELETE_PRODUCT = "DELETE FROM products WHERE store = ? AND sku_id = (SELECT id FROM skus WHERE name = ?)"
+_INSERT_CLOSE = (
+    "INSERT INTO day_closes (store, day, count, cost, sold, acc, cash, card, closed_at, closed_by) "
+    "VALUES (:store, :day, :count, :cost, :sold, :acc, :cash, :card, :closed_at, :closed_by)"
+)
+_SELECT_CLOSE = "SELECT * FROM day_closes WHERE store = ? AND day = ?"
+_SELECT_CLOSES = "SELECT * FROM day_closes WHERE store = ? ORDER BY day DESC LIMIT ?"
+_SELECT_AVAILABILITY = (
+    "SELECT store, qty FROM inventory WHERE sku_id = (SELECT id FROM skus WHERE name = ?) AND qty > 0 "
+    "ORDER BY qty DESC, store"
+)
+# A store receiving a product it has no cost for takes the sending store's
+_COPY_COST = (
+    "INSERT OR IGNORE INTO products (store, sku_id, cost) "
+    "SELECT ?, sku_id, cost FROM products WHERE store = ? AND sku_id = (SELECT id FROM skus WHERE name = ?)"
+)
+_INSERT_TRANSFER = (
+    "INSERT INTO transfers (sku_id, from_store, to_store, qty, moved_at, moved_by) "
+    "VALUES ((SELECT id FROM skus WHERE name = :product), :from_store, :to_store, :qty, :moved_at, :moved_by)"
+)
+_SELECT_TRANSFERS = (
+    "SELECT t.id, k.name AS product, t.from_store, t.to_store, t.qty, t.moved_at, t.moved_by "
+    "FROM transfers t JOIN skus k ON k.id = t.sku_id"
+)
+_SELECT_STORE_TRANSFERS = (
+    f"SELECT * FROM ({_SELECT_TRANSFERS} WHERE t.from_store = ?1 "
+    f"UNION ALL {_SELECT_TRANSFERS} WHERE t.to_store = ?1) ORDER BY id DESC LIMIT ?2"
+)
+_SELECT_JOURNAL_SEQ = "SELECT value FROM meta WHERE key = 'journal_seq'"
+_SET_JOURNAL_SEQ = "UPDATE meta SET value = ? WHERE key = 'journal_seq'"
+_SELECT_ANY_DATA = (
+    "SELECT EXISTS (SELECT 1 FROM sales) OR EXISTS (SELECT 1 FROM inventory) OR EXISTS (SELECT 1 FROM products)"
+)
+
+SALE_FIELDS = ("uid", "employee", "store", "date", "type", "cost", "sold", "acc", "payment_method")
+
+# Columns sales may be sorted by (keys are accepted from callers, values go into SQL)
+SORT_COLUMNS = {
+    "ts": "ts",
+    "employee": "employee",
+    "store": "store",
+    "type": "type",
+    "cost": "cost",
+    "sold": "sold",
+    "acc": "acc",
+    "payment_method": "payment_method",
+}
+
+class CatalogError(Exception):
+    """A catalog change would clash with an existing product; nothing was written."""
+
+
+class Database:
+    """SQLite store (WAL mode) shared by every session through a small connection pool."""
+
+    def __init__(self, path, pool_size=4, journal_dir=None, summaries=True):
+        self.path = path
+        self.journal = None
+        if journal_dir is not None:
+            self.journal = Journal(journal_dir)
+            if not os.path.exists(path) and os.path.exists(self.journal.snapshot_path):
+                # Lost database: start from the last snapshot, then replay the tail
+                shutil.copyfile(self.journal.snapshot_path, path)
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        for _ in range(pool_size):
+            self._pool.put(None)  # connections are opened on first use
+        self.changes = ChangeFeed()
+        self.cache = VersionedCache(self.changes)
+        self._snapshotting = threading.Lock()
+        self._ledger = None  # grown by load_ledger, dropped by _record
+        self._ledger_lock = threading.Lock()
+        with self.connection() as conn:
+            self._migrate(conn)
+        if self.journal is not None:
+            self._replay_journal()
+            self._snapshot_existing()
+        # Compacts closed days into daily_summaries in the background
+        self.summaries = _summaries.SummaryWorker(self) if summaries else None
+
+    # ---------- Connections ----------
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=30,
+            isolation_level=None,  # transactions are managed explicitly
+            check_same_thread=False,
+            cached_statements=256,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA foreign_keys = ON")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        conn = self._pool.get()
+        if conn is None:
+            conn = self._connect()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    @contextmanager
+    def transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front so readers never see half a write
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def _migrate(self, conn):
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for number, step in enumerate(_MIGRATIONS[version:], start=version + 1):
+            if not callable(step):
+                # executescript commits on its own, so the script carries its transaction
+                conn.executescript(f"BEGIN IMMEDIATE;\n{step}\nPRAGMA user_version = {number};\nCOMMIT;")
+                continue
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                step(conn)
+                conn.execute(f"PRAGMA user_version = {number}")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def close(self):
+        if self.summaries is not None:
+            self.summaries.close()
+        if self.journal is not None:
+            self.journal.close()
+        while True:
+            try:
+                conn = self._pool.get_nowait()
+            except queue.Empty:
+                break
+            if conn is not None:
+                conn.close()
+
+    # ---------- Journal ----------
+    def _record(self, kind, **data):
+        # Apply the change and append its event in the same transaction; the
+        # event's sequence number is committed with it, so after a crash the
+        # database knows exactly which journal events it still needs.
+        with self.transaction() as conn:
+            result, touched = _HANDLERS[kind](conn, data)
+            if self.journal is not None:
+                conn.execute(_SET_JOURNAL_SEQ, (self.journal.append(kind, data),))
+        if kind in _LEDGER_REWRITES or (SALES, None) in touched:
+            # Sales already in the ledger changed (or were renamed); before
+            # publishing, so no reader caches the old rows under the new version
+            with self._ledger_lock:
+                self._ledger = None
+        for topic, store in touched:
+            self.changes.publish(topic, store)
+        if self.journal is not None and self.journal.snapshot_due():
+            threading.Thread(target=self.snapshot, name="journal-snapshot", daemon=True).start()
+        return result
+
+    def _journal_seq(self, conn):
+        return conn.execute(_SELECT_JOURNAL_SEQ).fetchone()[0]
+
+    def _replay_journal(self):
+        with self.connection() as conn:
+            applied = self._journal_seq(conn)
+        for event in self.journal.events(after=applied):
+            with self.transaction() as conn:
+                _HANDLERS[event["kind"]](conn, event["data"])
+                conn.execute(_SET_JOURNAL_SEQ, (event["seq"],))
+            applied = event["seq"]
+        self.journal.advance_to(applied)
+
+    def _snapshot_existing(self):
+        # A database with data but no journal yet (journaling just switched
+        # on) gets a starting snapshot now; replaying onto an empty schema
+        # would otherwise lose everything written before the first event
+        with self.connection() as conn:
+            unjournaled = self._journal_seq(conn) == 0 and conn.execute(_SELECT_ANY_DATA).fetchone()[0]
+        if unjournaled:
+            self.snapshot()
+
+    def snapshot(self):
+        # Copy the live database with the online backup API (readers and
+        # writers carry on), then archive the journal lines the copy contains.
+        if not self._snapshotting.acquire(blocking=False):
+            return
+        try:
+            scratch = self.journal.snapshot_path + ".tmp"
+            target = sqlite3.connect(scratch)
+            try:
+                with self.connection() as conn:
+                    conn.backup(target)
+                seq = target.execute(_SELECT_JOURNAL_SEQ).fetchone()[0]
+            finally:
+                target.close()
+            os.replace(scratch, self.journal.snapshot_path)
+            self.journal.rotate(seq)
+        finally:
+            self._snapshotting.release()
+
+    # ---------- Sales ----------
+    def load_sales(self):
+        with self.connection() as conn:
+            sales = {row["id"]: _sale_from_row(row) for row in conn.execute(_SELECT_SALES)}
+            for item in conn.execute(_SELECT_ITEMS):
+                sale = sales.get(item["sale_id"])
+                if sale is not None:
+                    sale["products"].append(_item_from_row(item))
+        return list(sales.values())
+
+    def add_sale(self, sale):
+        return self._record("add_sale", sale=_with_uid(sale))
+
+    def add_sales(self, sales):
+        # Appends a batch of sales (no stock taken) in one transaction
+        return self._record("add_sales", sales=[_with_uid(sale) for sale in sales])
+
+    def checkout(self, sale):
+        # Every line is decremented and the sale appended in one transaction:
+        # either all of it commits or none of it does.
+        return self._record("checkout", sale=_with_uid(sale))
+
+    def sync_sales(self, sales):
+        # A batch from an OfflineRegister's queue, as one transaction. Returns
+        # {uid: (status, message)}: "applied"; "duplicate" for a uid already
+        # stored (a batch resent after a lost reply); or "oversold" when the
+        # stock left cannot cover the lines, in which case nothing is written.
+        return self._record("sync_sales", sales=[_with_uid(sale) for sale in sales])
+
+    def update_sale(self, uid, sale):
+        self._record("update_sale", uid=uid, sale={**_as_dict(sale), "uid": uid})
+
+    def delete_sale(self, uid):
+        self._record("delete_sale", uid=uid)
+
+    def replace_sales(self, sales):
+        self._record("replace_sales", sales=[_with_uid(sale) for sale in sales])
+
+    def query_sales(self, store=None, employee=None, start=None, end=None,
+                    order_by="ts", descending=False, limit=None, offset=0):
+        # start is inclusive and end exclusive; both take datetimes or sale date strings.
+        # With a limit only that page of sales (and their line items) is read.
+        where, params = _sales_filter(store, employee, start, end)
+        direction = "DESC" if descending else "ASC"
+        sql = f"SELECT * FROM sales WHERE {where} ORDER BY {SORT_COLUMNS[order_by]} {direction}, id {direction}"
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params = params + [limit, offset]
+        with self.connection() as conn:
+            sales = {row["id"]: _sale_from_row(row) for row in conn.execute(sql, params)}
+            if limit is not None:
+                marks = ", ".join("?" * len(sales))
+                items = conn.execute(
+                    f"{_SELECT_ITEM_ROWS} WHERE i.sale_id IN ({marks}) ORDER BY i.sale_id, i.pos",
+                    list(sales),
+                )
+            else:
+                items = conn.execute(
+                    f"{_SELECT_ITEM_ROWS} WHERE i.sale_id IN (SELECT id FROM sales WHERE {where}) "
+                    "ORDER BY i.sale_id, i.pos",
+                    params,
+                )
+            for item in items:
+                sales[item["sale_id"]]["products"].append(_item_from_row(item))
+        return list(sales.values())
+
+    def count_sales(self, store=None, employee=None, start=None, end=None):
+        if start is None and end is None and (store is None or employee is None):
+            # Whole-history counts are already kept in sale_totals
+            if store is not None:
+                return self.totals("store", store)["count"]
+            if employee is not None:
+                return self.totals("employee", employee)["count"]
+            return self.totals()["count"]
+        where, params = _sales_filter(store, employee, start, end)
+        with self.connection() as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM sales WHERE {where}", params).fetchone()[0]
+
+    def iter_sale_lines(self, store=None, employee=None, start=None, end=None, batch=1000):
+        # One row per line item joined with its sale, fetched batch by batch so
+        # an export never holds more than `batch` rows in memory.
+        where, params = _sales_filter(store, employee, start, end)
+        with self.connection() as conn:
+            cursor = conn.execute(
+                "SELECT s.*, COALESCE(k.name, i.name) AS name, i.quantity, i.cost AS item_cost, "
+                "i.sold AS item_sold FROM sales s JOIN sale_items i ON i.sale_id = s.id "
+                f"LEFT JOIN skus k ON k.id = i.sku_id WHERE {where} "
+                "ORDER BY s.ts, s.id, i.pos",
+                params,
+            )
+            while True:
+                rows = cursor.fetchmany(batch)
+                if not rows:
+                    break
+                yield from rows
+
+    def employees(self):
+        with self.connection() as conn:
+            return [row["key"] for row in conn.execute(_SELECT_EMPLOYEES)]
+
+    def load_ledger(self):
+        # The columnar ledger of every sale. It is kept between calls and only
+        # the sales added since are read in; an edit, delete, reset or rename
+        # makes the next call rebuild it. Returns a frozen view, so callers can
+        # share it while later calls grow the ledger.
+        # Imported here so the app only pays for NumPy when a report needs it
+        from .ledger import SalesLedger, ledger_from_rows
+
+        with self._ledger_lock:
+            if self._ledger is None:
+                self._ledger = SalesLedger()
+            last = self._ledger.last_id
+            with self.connection() as conn:
+                ledger_from_rows(
+                    conn.execute(_SELECT_SALES_AFTER, (last,)), conn.execute(_SELECT_ITEMS_AFTER, (last,)), self._ledger
+                )
+            return self._ledger.frozen()
+
+    # ---------- Totals ----------
+    def totals(self, dim="all", key=""):
+        with self.connection() as conn:
+            return _totals.read_totals(conn, dim, key)
+
+    def range_totals(self, start, end, dim="all", key="", today=None):
+        # Totals for the days start <= day < end (dates), with dim "all",
+        # "store" or "employee": closed days come from daily_summaries and
+        # only the rest (normally just today) from raw sales.
+        today = today or date.today()
+        with self.connection() as conn:
+            totals, pending = _summaries.range_totals(conn, start, end, today, dim, key)
+        if pending and self.summaries is not None:
+            self.summaries.request()
+        return totals
+
+    def bucket_totals(self, start, end, bucket="day", dim="store", today=None):
+        # {(bucket label, key): totals} for start <= day < end, bucket one of
+        # "day", "week", "month" or "year"; dim "store" compares stores
+        today = today or date.today()
+        with self.connection() as conn:
+            return _summaries.bucket_totals(conn, start, end, today, bucket, dim)
+
+    def compact_summaries(self, today=None):
+        # Fills in daily_summaries for every closed day that lacks them, a
+        # month of days per transaction so writers are never held up long.
+        # Returns how many days were compacted.
+        today = today or date.today()
+        with self.connection() as conn:
+            days = _summaries.missing_days(conn, today)
+        for first in range(0, len(days), 31):
+            with self.transaction() as conn:
+                for day in days[first:first + 31]:
+                    _summaries.compact_day(conn, day)
+        return len(days)
+
+    # ---------- End of day ----------
+    def close_day(self, store, day, closed_by):
+        # Freezes the store's totals for `day` (a date). Closing a day that is
+        # already closed changes nothing and returns the original close.
+        return self._record(
+            "close_day",
+            store=store,
+            day=day.isoformat(),
+            closed_by=closed_by,
+            closed_at=datetime.now().strftime(DATE_FORMAT),
+        )
+
+    def day_close(self, store, day):
+        with self.connection() as conn:
+            row = conn.execute(_SELECT_CLOSE, (store, day.isoformat())).fetchone()
+        return None if row is None else dict(row)
+
+    def day_closes(self, store, limit=31):
+        # The most recent closes first
+        with self.connection() as conn:
+            return [dict(row) for row in conn.execute(_SELECT_CLOSES, (store, limit))]
+
+    # ---------- Inventory ----------
+    def stock_outlook(self, store, now=None, lead_days=_velocity.LEAD_DAYS, target_days=_velocity.TARGET_DAYS):
+        # Every product stocked at `store` with its sales rate, days of cover
+        # and, when cover is under lead_days, the quantity to reorder
+        now = to_timestamp(now or datetime.now())
+        with self.connection() as conn:
+            return _velocity.store_outlook(conn, store, now, lead_days, target_days)
+
+    def load_inventory(self):
+        inventory = {}
+        with self.connection() as conn:
+            for row in conn.execute(_SELECT_INVENTORY):
+                inventory.setdefault(row["store"], {})[row["product"]] = row["qty"]
+        return inventory
+
+    def store_inventory(self, store):
+        with self.connection() as conn:
+            return {row["product"]: row["qty"] for row in conn.execute(_SELECT_STORE_INVENTORY, (store,))}
+
+    def add_stock(self, store, product, qty):
+        return self._record("add_stock", store=store, product=product, qty=qty)
+
+    def replace_inventory(self, inventory):
+        self._record("replace_inventory", inventory=inventory)
+
+    def product_names(self):
+        # Every SKU name, whichever stores carry it
+        with self.connection() as conn:
+            return [row["name"] for row in conn.execute(_SELECT_SKU_NAMES)]
+
+    def availability(self, product):
+        # {store: qty} for every store holding any of `product`, most first;
+        # one lookup on the inventory_sku index whatever the number of stores
+        with self.connection() as conn:
+            return {row["store"]: row["qty"] for row in conn.execute(_SELECT_AVAILABILITY, (product,))}
+
+    def transfer_stock(self, product, from_store, to_store, qty, moved_by):
+        # Moves qty units between stores as one write: the debit, the credit and
+        # the transfers row commit together or not at all. Raises StockError if
+        # from_store has too few. Returns the two stores' new quantities.
+        if from_store == to_store:
+            raise ValueError("A transfer needs two different stores.")
+        if qty < 1:
+            raise ValueError("Transfer quantity must be at least 1.")
+        return self._record(
+            "transfer_stock",
+            product=product,
+            from_store=from_store,
+            to_store=to_store,
+            qty=qty,
+            moved_by=moved_by,
+            moved_at=datetime.now().strftime(DATE_FORMAT),
+        )
+
+    def transfers(self, store, limit=25):
+        # Transfers into or out of `store`, the most recent first
+        with self.connection() as conn:
+            return [dict(row) for row in conn.execute(_SELECT_STORE_TRANSFERS, (store, limit))]
+
+    def bulk_import(self, items):
+        # items: {(store, product): {"qty": n, "cost": float or None}}, as built
+        # by bulk.parse_inventory; applied to inventory and products together.
+        rows = [[store, product, item["qty"], item["cost"]] for (store, product), item in items.items()]
+        self._record("bulk_import", rows=rows)
+
+    # ---------- Products ----------
+    def load_products(self):
+        products = {}
+        with self.connection() as conn:
+            for row in conn.execute(_SELECT_PRODUCTS):
+                products.setdefault(row["store"], {})[row["product"]] = row["cost"]
+        return products
+
+    def store_products(self, store):
+        with self.connection() as conn:
+            return {row["product"]: row["cost"] for row in conn.execute(_SELECT_STORE_PRODUCTS, (store,))}
+
+    def set_product_cost(self, store, product, cost):
+        self._record("set_product_cost", store=store, product=product, cost=cost)
+
+    def rename_product(self, old_name, new_name):
+        # Renames the SKU itself: every store's inventory, products and past
+        # sale lines show the new name after this one write.
+        self._record("rename_product", old_name=old_name, new_name=new_name)
+
+    def delete_product(self, store, product):
+        self._record("delete_product", store=store, product=product)
+
+    def replace_products(self, products):
+        self._record("replace_products", products=products)
+
+    def edit_products(self, store, costs=(), renames=(), deletes=()):
+        # A whole batch of Manage Products edits as one write: costs is
+        # [(name, cost)], renames [(old, new)] and deletes [name], all by the
+        # names the batch was made against. Returns how many products changed.
+        return self._record(
+            "edit_products",
+            store=store,
+            costs=[list(change) for change in costs],
+            renames=[list(change) for change in renames],
+            deletes=list(deletes),
+        )
+
+
+# ---------- Write handlers ----------
+# Each takes (conn, data) inside an open transaction and returns
+# (result, [(topic, store), ...] it changed). The same handlers apply live
+# writes and replay journal events, so both paths stay identical.
+def _handle_add_sale(conn, data):
+    sale = data["sale"]
+    _insert_sale(conn, sale)
+    return sale["uid"], [(SALES, sale["store"])]
+
+
+def _handle_add_sales(conn, data):
+    for sale in data["sales"]:
+        _insert_sale(conn, sale)
+    stores = sorted({sale["store"] for sale in data["sales"]})
+    return [sale["uid"] for sale in data["sales"]], [(SALES, store) for store in stores]
+
+
+def _handle_checkout(conn, data):
+    sale = data["sale"]
+    for item in sale["products"]:
+        if item["name"] not in UNSTOCKED_ITEMS:
+            _take_stock(conn, sale["store"], item["name"], item["quantity"])
+    _insert_sale(conn, sale)
+    return sale["uid"], [(SALES, sale["store"]), (INVENTORY, sale["store"])]
+
+
+def _handle_sync_sales(conn, data):
+    results, stores = {}, set()
+    for sale in data["sales"]:
+        if conn.execute(_SELECT_SALE, (sale["uid"],)).fetchone() is not None:
+            results[sale["uid"]] = ("duplicate", None)
+            continue
+        needed = stock_needed(LineItem.from_dict(item) for item in sale["products"])
+        shortfall = None
+        for name, qty in needed.items():
+            row = conn.execute(_SELECT_QTY, (sale["store"], name)).fetchone()
+            if row is None or row["qty"] < qty:
+                shortfall = StockError(sale["store"], name, None if row is None else row["qty"])
+                break
+        if shortfall is not None:
+            results[sale["uid"]] = ("oversold", str(shortfall))
+            continue
+        for name, qty in needed.items():
+            _take_stock(conn, sale["store"], name, qty)
+        _insert_sale(conn, sale)
+        results[sale["uid"]] = ("applied", None)
+        stores.add(sale["store"])
+    return results, [(SALES, store) for store in sorted(stores)] + [(INVENTORY, store) for store in sorted(stores)]
+
+
+def _handle_update_sale(conn, data):
+    old = conn.execute(_SELECT_SALE, (data["uid"],)).fetchone()
+    if old is None:
+        return None, []
+    sale = data["sale"]
+    _totals.apply_sale(conn, old, -1)
+    _summaries.invalidate(conn, old)
+    _velocity.apply_sale(conn, old["id"], old["store"], old["ts"], -1)
+    params = _sale_params(sale)
+    conn.execute(_UPDATE_SALE, {**params, "id": old["id"]})
+    conn.execute("DELETE FROM sale_items WHERE sale_id = ?", (old["id"],))
+    _insert_items(conn, old["id"], sale["products"])
+    _totals.apply_sale(conn, sale)
+    _velocity.apply_sale(conn, old["id"], sale["store"], params["ts"])
+    _summaries.invalidate(conn, sale)
+    return None, [(SALES, old["store"]), (SALES, sale["store"])]
+
+
+def _handle_delete_sale(conn, data):
+    old = conn.execute(_SELECT_SALE, (data["uid"],)).fetchone()
+    if old is None:
+        return None, []
+    _totals.apply_sale(conn, old, -1)
+    _summaries.invalidate(conn, old)
+    _velocity.apply_sale(conn, old["id"], old["store"], old["ts"], -1)
+    conn.execute("DELETE FROM sales WHERE id = ?", (old["id"],))
+    return None, [(SALES, old["store"])]
+
+
+def _handle_replace_sales(conn, data):
+    conn.execute("DELETE FROM sales")
+    conn.execute("DELETE FROM sale_totals")
+    conn.execute("DELETE FROM daily_summaries")
+    conn.execute("DELETE FROM sku_velocity")
+    for sale in data["sales"]:
+        _insert_sale(conn, sale)
+    return None, [(SALES, None)]
+
+
+def _handle_close_day(conn, data):
+    store, day = data["store"], data["day"]
+    closed = conn.execute(_SELECT_CLOSE, (store, day)).fetchone()
+    if closed is not None:
+        return dict(closed), []
+    start = date.fromisoformat(day)
+    # Read under the write lock, so no sale can land between the sum and the close
+    totals = _summaries.live_totals(conn, start, start + timedelta(days=1), "store", store)
+    conn.execute(_INSERT_CLOSE, {**totals, **data})
+    return dict(conn.execute(_SELECT_CLOSE, (store, day)).fetchone()), [(CLOSES, store)]
+
+
+def _handle_add_stock(conn, data):
+    store, product = data["store"], data["product"]
+    added = _add_skus(conn, [product])
+    conn.execute(_UPSERT_STOCK, (store, product, data["qty"]))
+    return conn.execute(_SELECT_QTY, (store, product)).fetchone()[0], [(INVENTORY, store)] + added
+
+
+def _handle_transfer_stock(conn, data):
+    product, from_store, to_store = data["product"], data["from_store"], data["to_store"]
+    _take_stock(conn, from_store, product, data["qty"])
+    conn.execute(_UPSERT_STOCK, (to_store, product, data["qty"]))
+    conn.execute(_COPY_COST, (to_store, from_store, product))
+    _require_cost(conn, to_store, product, f"'{product}' has no cost price in {from_store} to carry over to {to_store}")
+    conn.execute(_INSERT_TRANSFER, data)
+    quantities = tuple(conn.execute(_SELECT_QTY, (store, product)).fetchone()[0] for store in (from_store, to_store))
+    return quantities, [(INVENTORY, from_store), (INVENTORY, to_store), (PRODUCTS, to_store)]
+
+
+def _handle_replace_inventory(conn, data):
+    conn.execute("DELETE FROM inventory")
+    rows = _flatten(data["inventory"])
+    added = _add_skus(conn, [product for _, product, _ in rows])
+    conn.executemany(_SET_STOCK, rows)
+    return None, [(INVENTORY, None)] + added
+
+
+def _handle_bulk_import(conn, data):
+    rows = data["rows"]
+    added = _add_skus(conn, [product for _, product, _, _ in rows])
+    conn.executemany(_UPSERT_STOCK, [(store, product, qty) for store, product, qty, _ in rows])
+    conn.executemany(_SET_COST, [(store, product, cost) for store, product, _, cost in rows if cost is not None])
+    for store, product, _, cost in rows:
+        if cost is None:
+            _require_cost(conn, store, product)
+    stores = sorted({row[0] for row in rows})
+    return None, [(INVENTORY, store) for store in stores] + [(PRODUCTS, store) for store in stores] + added
+
+
+def _handle_set_product_cost(conn, data):
+    added = _add_skus(conn, [data["product"]])
+    conn.execute(_SET_COST, (data["store"], data["product"], data["cost"]))
+    return None, [(PRODUCTS, data["store"])] + added
+
+
+def _handle_rename_product(conn, data):
+    if not _rename_sku(conn, data["old_name"], data["new_name"]):
+        return None, []
+    return None, [(PRODUCTS, None), (INVENTORY, None), (SALES, None), (CATALOG, None)]
+
+
+def _handle_delete_product(conn, data):
+    conn.execute(_DELETE_PRODUCT, (data["store"], data["product"]))
+    return None, [(PRODUCTS, data["store"])]
+
+
+def _handle_edit_products(conn, data):
+    store = data["store"]
+    # Deletes and costs first, while the batch's names still match the catalog
+    conn.executemany(_DELETE_PRODUCT, [(store, name) for name in data["deletes"]])
+    conn.executemany(_SET_COST, [(store, name, cost) for name, cost in data["costs"]])
+    renamed = [_rename_sku(conn, old, new) for old, new in data["renames"]]
+    changed = {*data["deletes"], *(name for name, _ in data["costs"]), *(old for old, _ in data["renames"])}
+    touched = [(PRODUCTS, store)]
+    if any(renamed):
+        touched += [(PRODUCTS, None), (INVENTORY, None), (SALES, None), (CATALOG, None)]
+    return len(changed), touched
+
+
+def _handle_replace_products(conn, data):
+    conn.execute("DELETE FROM products")
+    rows = _flatten(data["products"])
+    added = _add_skus(conn, [product for _, product, _ in rows])
+    conn.executemany(_SET_COST, rows)
+    return None, [(PRODUCTS, None)] + added
+
+
+# Writes that change sales load_ledger may already hold; those touching every
+# store's SALES (resets, renames) count too
+_LEDGER_REWRITES = {"update_sale", "delete_sale"}
+
+_HANDLERS = {
+    "add_sale": _handle_add_sale,
+    "add_sales": _handle_add_sales,
+    "checkout": _handle_checkout,
+    "sync_sales": _handle_sync_sales,
+    "update_sale": _handle_update_sale,
+    "delete_sale": _handle_delete_sale,
+    "replace_sales": _handle_replace_sales,
+    "close_day": _handle_close_day,
+    "add_stock": _handle_add_stock,
+    "replace_inventory": _handle_replace_inventory,
+    "transfer_stock": _handle_transfer_stock,
+    "bulk_import": _handle_bulk_import,
+    "set_product_cost": _handle_set_product_cost,
+    "rename_product": _handle_rename_product,
+    "delete_product": _handle_delete_product,
+    "edit_products": _handle_edit_products,
+    "replace_products": _handle_replace_products,
+}
+
+
+# ---------- Row helpers ----------
+def _as_dict(sale):
+    # Writes accept Sale records or sale dicts; events always carry dicts
+    return sale.to_dict() if isinstance(sale, Sale) else sale
+
+
+def _with_uid(sale):
+    # Stable id that survives replay and rebuilds, unlike the integer rowid
+    sale = {field: value for field, value in _as_dict(sale).items() if field != "id"}
+    sale.setdefault("uid", uuid.uuid4().hex)
+    return sale
+
+
+def _sale_params(sale):
+    params = {field: sale[field] for field in SALE_FIELDS}
+    params["ts"] = to_timestamp(sale["date"])
+    return params
+
+
+def _sales_filter(store, employee, start, end):
+    # Every combination is served by one of the (store, ts), (employee, ts)
+    # or (ts) B-tree indexes, so cost follows the number of matching rows.
+    clauses, params = [], []
+    if store is not None:
+        clauses.append("store = ?")
+        params.append(store)
+    if employee is not None:
+        clauses.append("employee = ?")
+        params.append(employee)
+    if start is not None:
+        clauses.append("ts >= ?")
+        params.append(to_timestamp(start))
+    if end is not None:
+        clauses.append("ts < ?")
+        params.append(to_timestamp(end))
+    return " AND ".join(clauses) or "1", params
+
+
+def _insert_sale(conn, sale):
+    params = _sale_params(sale)
+    sale_id = conn.execute(_INSERT_SALE, params).lastrowid
+    _insert_items(conn, sale_id, sale["products"])
+    _totals.apply_sale(conn, sale)
+    _velocity.apply_sale(conn, sale_id, sale["store"], params["ts"])
+    _summaries.invalidate(conn, sale)
+    return sale_id
+
+
+def _add_skus(conn, names):
+    # New names get the next id; known ones keep theirs. Returns the change
+    # to publish: [(CATALOG, None)] if any name was new, else []
+    added = conn.executemany(_ADD_SKU, [(name,) for name in dict.fromkeys(names)]).rowcount
+    return [(CATALOG, None)] if added > 0 else []
+
+
+def _rename_sku(conn, old_name, new_name):
+    # Returns whether anything was renamed
+    if not new_name:
+        raise CatalogError("Product name cannot be empty.")
+    sku = conn.execute(_SELECT_SKU, (old_name,)).fetchone()
+    if sku is None or old_name == new_name:
+        return False
+    if conn.execute(_SELECT_SKU, (new_name,)).fetchone() is not None:
+        raise CatalogError(f"Product '{new_name}' already exists.")
+    conn.execute(_RENAME_SKU, (new_name, sku["id"]))
+    return True
+
+
+def _require_cost(conn, store, product, problem=None):
+    # Stock without a products row cannot be sold: Add Sale offers a store's
+    # priced products only. Raising here rolls the whole write back.
+    if conn.execute(_SELECT_COST, (store, product)).fetchone() is None:
+        problem = problem or f"'{product}' has no cost price in {store}"
+        raise CatalogError(f"{problem}; set one in Inventory first.")
+
+
+def _take_stock(conn, store, product, qty):
+    if conn.execute(_TAKE_STOCK, (qty, store, product, qty)).rowcount == 0:
+        row = conn.execute(_SELECT_QTY, (store, product)).fetchone()
+        raise StockError(store, product, None if row is None else row["qty"])
+
+
+def _insert_items(conn, sale_id, items):
+    conn.executemany(
+        _INSERT_ITEM,
+        [(sale_id, pos, p["name"], p["quantity"], p["cost"], p["sold"]) for pos, p in enumerate(items)],
+    )
+
+
+def _sale_from_row(row):
+    sale = {"id": row["id"]}
+    sale.update((field, row[field]) for field in SALE_FIELDS)
+    sale["products"] = []
+    return sale
+
+
+def _item_from_row(row):
+    return {"name": row["name"], "quantity": row["quantity"], "cost": row["cost"], "sold": row["sold"]}
+
+
+def _flatten(nested):
+    return [(store, key, value) for store, values in nested.items() for key, value in values.items()]
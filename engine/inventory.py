@@ -0,0 +1,60 @@
+"""Stock and catalog rules as pure functions over {product: qty} / {product: cost} dicts.
+
+Database applies the same rules inside its transactions; these let callers
+check a cart or a catalog edit against a cached copy without touching storage.
+"""
+
+from collections import Counter
+
+# Sale lines that never touch inventory
+UNSTOCKED_ITEMS = {"Bill Payment"}
+
+
+class StockError(Exception):
+    """A sale line could not be taken from inventory; nothing was written."""
+
+    def __init__(self, store, product, available):
+        self.store = store
+        self.product = product
+        self.available = available
+        if available is None:
+            message = f"Product '{product}' not found in inventory at {store}."
+        else:
+            message = f"Not enough stock for '{product}'. Available: {available}"
+        super().__init__(message)
+
+
+def stock_needed(items):
+    # Units per product across a sale's lines; repeated products add up
+    needed = Counter()
+    for item in items:
+        if item.name not in UNSTOCKED_ITEMS:
+            needed[item.name] += item.quantity
+    return needed
+
+
+def stock_shortfalls(store, inventory, items):
+    # One StockError per product the lines ask more of than `inventory` holds
+    return [
+        StockError(store, name, inventory.get(name))
+        for name, qty in stock_needed(items).items()
+        if inventory.get(name, 0) < qty
+    ]
+
+
+def catalog_edits(current, edited_rows):
+    # Turns a grid's edited rows ({row position: {column: value}}) over the
+    # products in `current` into the (costs, renames, deletes) lists that
+    # Database.edit_products takes. Unchanged values are dropped.
+    names = list(current)
+    costs, renames, deletes = [], [], []
+    for row, changes in edited_rows.items():
+        name = names[int(row)]
+        if changes.get("Delete"):
+            deletes.append(name)
+            continue
+        if changes.get("Cost") is not None and changes["Cost"] != current[name]:
+            costs.append((name, changes["Cost"]))
+        if "Product" in changes and (changes["Product"] or "").strip() != name:
+            renames.append((name, (changes["Product"] or "").strip()))
+    return costs, renames, deletes
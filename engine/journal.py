@@ -0,0 +1,153 @@
+"""Append-only JSONL journal of every sale, inventory and product change.
+
+Each line is ``{"seq": n, "kind": ..., "data": {...}}`` with a strictly
+increasing sequence number. Lines are flushed to the OS on every append and
+fsynced in batches: after ``fsync_every`` events, or at most ``fsync_interval``
+seconds after the first unsynced one.
+
+A snapshot is a copy of the SQLite database taken with the online backup API;
+it records the last journal sequence it contains, so recovery only replays the
+tail. ``rotate`` then moves the lines the snapshot already covers out to
+``journal-<seq>.jsonl``, so the live file stays short and the audit trail is
+kept whole across the archives.
+"""
+
+import json
+import os
+import threading
+import time
+
+JOURNAL_FILE = "journal.jsonl"
+SNAPSHOT_FILE = "snapshot.db"
+ARCHIVE_FILE = "journal-{seq}.jsonl"
+
+
+class Journal:
+    def __init__(self, directory, fsync_every=64, fsync_interval=1.0, snapshot_every=5000):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.path = os.path.join(directory, JOURNAL_FILE)
+        self.snapshot_path = os.path.join(directory, SNAPSHOT_FILE)
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.snapshot_every = snapshot_every
+
+        self._lock = threading.Lock()
+        self._unsynced = 0
+        self._unsynced_since = None
+        self._since_snapshot = 0
+        self.last_seq = 0
+        self._scan()
+        self._file = open(self.path, "a", encoding="utf-8")
+
+        self._closed = threading.Event()
+        self._syncer = threading.Thread(target=self._sync_loop, name="journal-fsync", daemon=True)
+        self._syncer.start()
+
+    def _scan(self):
+        # Find the last sequence number and cut off a line torn by a crash
+        if not os.path.exists(self.path):
+            return
+        good = 0
+        with open(self.path, "rb") as journal:
+            for line in journal:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    break
+                good += len(line)
+                self.last_seq = event["seq"]
+                self._since_snapshot += 1
+        if good < os.path.getsize(self.path):
+            with open(self.path, "r+b") as journal:
+                journal.truncate(good)
+
+    # ---------- Writing ----------
+    def append(self, kind, data):
+        with self._lock:
+            self.last_seq += 1
+            line = json.dumps({"seq": self.last_seq, "kind": kind, "data": data}, separators=(",", ":"))
+            self._file.write(line + "\n")
+            self._file.flush()
+            self._unsynced += 1
+            self._since_snapshot += 1
+            if self._unsynced_since is None:
+                self._unsynced_since = time.monotonic()
+            if self._unsynced >= self.fsync_every:
+                self._sync_locked()
+            return self.last_seq
+
+    def advance_to(self, seq):
+        # After compaction the file may be empty; never reuse a number the
+        # database has already applied.
+        with self._lock:
+            self.last_seq = max(self.last_seq, seq)
+
+    def sync(self):
+        with self._lock:
+            self._sync_locked()
+
+    def _sync_locked(self):
+        if self._unsynced:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+            self._unsynced_since = None
+
+    def _sync_loop(self):
+        while not self._closed.wait(self.fsync_interval / 2):
+            with self._lock:
+                since = self._unsynced_since
+                if since is not None and time.monotonic() - since >= self.fsync_interval:
+                    self._sync_locked()
+
+    def close(self):
+        self._closed.set()
+        with self._lock:
+            self._sync_locked()
+            self._file.close()
+
+    # ---------- Reading ----------
+    def events(self, after=0):
+        # Yields events with seq > after, oldest first
+        with open(self.path, encoding="utf-8") as journal:
+            for line in journal:
+                event = json.loads(line)
+                if event["seq"] > after:
+                    yield event
+
+    # ---------- Snapshots ----------
+    def snapshot_due(self):
+        return self._since_snapshot >= self.snapshot_every
+
+    def archives(self):
+        # Paths of the rotated journal files, oldest first
+        names = (name for name in os.listdir(self.directory) if name.startswith("journal-") and name.endswith(".jsonl"))
+        return [os.path.join(self.directory, name) for name in sorted(names, key=lambda name: int(name[8:-6]))]
+
+    def rotate(self, seq):
+        # Move the events a snapshot at `seq` already holds to an archive file,
+        # written (and fsynced) before the live journal is cut down to the tail
+        with self._lock:
+            self._sync_locked()
+            self._file.close()
+            covered, tail = [], []
+            with open(self.path, encoding="utf-8") as journal:
+                for line in journal:
+                    (tail if json.loads(line)["seq"] > seq else covered).append(line)
+            if covered:
+                _write_lines(os.path.join(self.directory, ARCHIVE_FILE.format(seq=seq)), covered)
+            _write_lines(self.path, tail)
+            self._file = open(self.path, "a", encoding="utf-8")
+            self._since_snapshot = len(tail)
+
+
+def _write_lines(path, lines):
+    # Replace `path` with `lines` in one rename, so a crash leaves the old file or the new one
+    scratch = path + ".tmp"
+    with open(scratch, "w", encoding="utf-8") as out:
+        out.writelines(lines)
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(scratch, path)
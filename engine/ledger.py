@@ -0,0 +1,232 @@
+"""Columnar, in-memory copy of the sales history for vectorized reporting.
+
+Each sale is one row across a set of NumPy arrays instead of a dict:
+store, employee and payment method are dictionary-encoded to small integer
+codes, the date is an int64 timestamp and the amounts are float64. Line items
+live in their own arrays pointing back at their sale's row. Group-by totals are
+then a single ``np.bincount`` per measure instead of a Python loop per sale.
+"""
+
+import numpy as np
+
+from .dates import to_timestamp
+
+
+class Codes:
+    """Dictionary encoding: each distinct value gets the next small integer."""
+
+    def __init__(self):
+        self.values = []
+        self._index = {}
+
+    def encode(self, value):
+        code = self._index.get(value)
+        if code is None:
+            code = self._index[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def get(self, value):
+        return self._index.get(value)
+
+    def __len__(self):
+        return len(self.values)
+
+
+class _Columns:
+    """Growable set of equal-length arrays (capacity doubles as rows are appended)."""
+
+    def __init__(self, dtypes, capacity):
+        self.size = 0
+        self.arrays = {name: np.empty(capacity, dtype=dtype) for name, dtype in dtypes.items()}
+
+    def append(self, **values):
+        if self.size == len(next(iter(self.arrays.values()))):
+            self._grow()
+        for name, value in values.items():
+            self.arrays[name][self.size] = value
+        self.size += 1
+        return self.size - 1
+
+    def _grow(self):
+        for name, array in self.arrays.items():
+            grown = np.empty(max(2 * len(array), 16), dtype=array.dtype)
+            grown[:self.size] = array[:self.size]
+            self.arrays[name] = grown
+
+    def __getitem__(self, name):
+        return self.arrays[name][:self.size]
+
+    def frozen(self):
+        # Views of the rows so far: later appends write past them or into grown
+        # copies, so the views never change under a reader
+        view = _Columns({}, 0)
+        view.size = self.size
+        view.arrays = {name: array[:self.size] for name, array in self.arrays.items()}
+        return view
+
+    @property
+    def nbytes(self):
+        return sum(array.itemsize * self.size for array in self.arrays.values())
+
+
+_SALE_COLUMNS = {
+    "id": np.int64,
+    "ts": np.int64,
+    "store": np.int32,
+    "employee": np.int32,
+    "payment": np.int8,
+    "cost": np.float64,
+    "sold": np.float64,
+    "acc": np.float64,
+}
+
+_ITEM_COLUMNS = {
+    "row": np.int64,  # row of the owning sale
+    "name": np.int32,
+    "quantity": np.int32,
+    "cost": np.float64,
+    "sold": np.float64,
+}
+
+_GROUP_COLUMNS = {"store": "store", "employee": "employee", "payment": "payment", "product": "name"}
+
+
+class SalesLedger:
+    def __init__(self, capacity=1024):
+        self.sales = _Columns(_SALE_COLUMNS, capacity)
+        self.items = _Columns(_ITEM_COLUMNS, capacity)
+        self.stores = Codes()
+        self.employees = Codes()
+        self.payments = Codes()
+        self.products = Codes()
+
+    @classmethod
+    def from_sales(cls, sales):
+        ledger = cls(capacity=max(len(sales), 16))
+        for sale in sales:
+            ledger.append(sale)
+        return ledger
+
+    def __len__(self):
+        return self.sales.size
+
+    @property
+    def last_id(self):
+        # Database id of the newest sale appended, 0 when empty
+        return int(self.sales["id"][-1]) if len(self) else 0
+
+    def frozen(self):
+        # Read-only copy sharing this ledger's arrays and code books, safe to
+        # hand to other threads while this one keeps growing
+        view = SalesLedger.__new__(SalesLedger)
+        view.__dict__.update(self.__dict__)
+        view.sales, view.items = self.sales.frozen(), self.items.frozen()
+        return view
+
+    @property
+    def nbytes(self):
+        # Array payload only; the code books hold one string per distinct value
+        return self.sales.nbytes + self.items.nbytes
+
+    def append(self, sale):
+        row = self.sales.append(
+            id=sale.get("id", -1),
+            ts=to_timestamp(sale["date"]),
+            store=self.stores.encode(sale["store"]),
+            employee=self.employees.encode(sale["employee"]),
+            payment=self.payments.encode(sale["payment_method"]),
+            cost=sale["cost"],
+            sold=sale["sold"],
+            acc=sale["acc"],
+        )
+        for item in sale.get("products", []):
+            self.items.append(
+                row=row,
+                name=self.products.encode(item["name"]),
+                quantity=item["quantity"],
+                cost=item["cost"],
+                sold=item["sold"],
+            )
+        return row
+
+    # ---------- Filtering ----------
+    def mask(self, store=None, employee=None, start=None, end=None):
+        keep = np.ones(len(self), dtype=bool)
+        for codes, column, value in ((self.stores, "store", store), (self.employees, "employee", employee)):
+            if value is not None:
+                code = codes.get(value)
+                if code is None:
+                    return np.zeros(len(self), dtype=bool)
+                keep &= self.sales[column] == code
+        if start is not None:
+            keep &= self.sales["ts"] >= to_timestamp(start)
+        if end is not None:
+            keep &= self.sales["ts"] < to_timestamp(end)
+        return keep
+
+    # ---------- Reporting ----------
+    def totals(self, mask=None):
+        columns = {name: self.sales[name] for name in ("cost", "sold", "acc", "payment")}
+        if mask is not None:
+            columns = {name: values[mask] for name, values in columns.items()}
+        totals = {name: float(columns[name].sum()) for name in ("cost", "sold", "acc")}
+        for field, method in (("cash", "Cash"), ("card", "Card")):
+            code = self.payments.get(method)
+            sold = columns["sold"][columns["payment"] == code] if code is not None else columns["sold"][:0]
+            totals[field] = float(sold.sum())
+        totals["count"] = int(len(columns["sold"]))
+        return totals
+
+    def group_totals(self, by, mask=None):
+        # by: "store", "employee", "payment" or "product" (product sums line items)
+        codes = {"store": self.stores, "employee": self.employees,
+                 "payment": self.payments, "product": self.products}[by]
+        if by == "product":
+            table, keep = self.items, None if mask is None else mask[self.items["row"]]
+            measures = ("quantity", "cost", "sold")
+        else:
+            table, keep = self.sales, mask
+            measures = ("cost", "sold", "acc")
+        keys = table[_GROUP_COLUMNS[by]]
+        if keep is not None:
+            keys = keys[keep]
+        sums = {}
+        for measure in measures:
+            weights = table[measure] if keep is None else table[measure][keep]
+            sums[measure] = np.bincount(keys, weights=weights, minlength=len(codes))
+        counts = np.bincount(keys, minlength=len(codes))
+        return {
+            codes.values[code]: {**{m: float(sums[m][code]) for m in measures}, "count": int(counts[code])}
+            for code in np.flatnonzero(counts)
+        }
+
+
+def ledger_from_rows(sale_rows, item_rows, ledger=None):
+    # Build straight from database cursors without materialising sale dicts;
+    # every sale row is read before the first item row. With `ledger`, the
+    # rows are appended to it (items of sales not in sale_rows are skipped).
+    ledger = SalesLedger() if ledger is None else ledger
+    rows = {}
+    for row in sale_rows:
+        rows[row["id"]] = ledger.sales.append(
+            id=row["id"],
+            ts=row["ts"],
+            store=ledger.stores.encode(row["store"]),
+            employee=ledger.employees.encode(row["employee"]),
+            payment=ledger.payments.encode(row["payment_method"]),
+            cost=row["cost"],
+            sold=row["sold"],
+            acc=row["acc"],
+        )
+    for item in item_rows:
+        row = rows.get(item["sale_id"])
+        if row is not None:
+            ledger.items.append(
+                row=row,
+                name=ledger.products.encode(item["name"]),
+                quantity=item["quantity"],
+                cost=item["cost"],
+                sold=item["sold"],
+            )
+    return ledger
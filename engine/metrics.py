@@ -0,0 +1,175 @@
+"""Timing spans and counters for each script rerun, aggregated per process.
+
+A RerunProfile collects what one rerun did: a span per helper call (timed
+with the ``timed`` decorator or ``span`` block), a span per top-level phase
+such as the menu branch drawn, plus counters and gauges. When the rerun ends
+the profile is folded into Metrics, which keeps call counts, total and worst
+times per span for the whole process and renders them as Prometheus text or
+JSON.
+"""
+
+import json
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+
+PROMETHEUS_PREFIX = "tw"
+
+
+class RerunProfile:
+    def __init__(self, first_phase="setup"):
+        self.started = time.perf_counter()
+        self.seconds = None
+        self.spans = []  # (name, seconds), in the order they finished
+        self.counts = defaultdict(int)
+        self.gauges = {}
+        self._phase = (first_phase, self.started)
+
+    @property
+    def finished(self):
+        return self.seconds is not None
+
+    @contextmanager
+    def span(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            # Widget callbacks run before the next rerun starts and may call
+            # helpers from a finished rerun; those calls are not counted
+            if not self.finished:
+                self.spans.append((name, time.perf_counter() - started))
+
+    def timed(self, func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.span(func.__name__):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    def phase(self, name):
+        # Ends the current top-level phase and starts the next one
+        now = time.perf_counter()
+        self.spans.append((self._phase[0], now - self._phase[1]))
+        self._phase = (name, now)
+
+    def count(self, name, amount=1):
+        self.counts[name] += amount
+
+    def gauge(self, name, value):
+        self.gauges[name] = value
+
+    def finish(self):
+        if not self.finished:
+            now = time.perf_counter()
+            self.spans.append((self._phase[0], now - self._phase[1]))
+            self.seconds = now - self.started
+        return self
+
+    def span_totals(self):
+        # {name: (calls, seconds)}, slowest first
+        totals = defaultdict(lambda: [0, 0.0])
+        for name, seconds in self.spans:
+            totals[name][0] += 1
+            totals[name][1] += seconds
+        return dict(sorted(((k, tuple(v)) for k, v in totals.items()), key=lambda item: -item[1][1]))
+
+
+class Metrics:
+    """Process-wide totals over every finished rerun of every session."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.reruns = 0
+        self.rerun_seconds = 0.0
+        self.rerun_seconds_max = 0.0
+        self.spans = {}  # name -> [calls, seconds, max seconds]
+        self.counters = defaultdict(int)
+        self.gauges = {}
+
+    def record(self, profile):
+        with self._lock:
+            self.reruns += 1
+            self.rerun_seconds += profile.seconds
+            self.rerun_seconds_max = max(self.rerun_seconds_max, profile.seconds)
+            for name, seconds in profile.spans:
+                entry = self.spans.setdefault(name, [0, 0.0, 0.0])
+                entry[0] += 1
+                entry[1] += seconds
+                entry[2] = max(entry[2], seconds)
+            for name, amount in profile.counts.items():
+                self.counters[name] += amount
+            self.gauges.update(profile.gauges)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "uptime_seconds": time.time() - self.started,
+                "reruns": self.reruns,
+                "rerun_seconds": self.rerun_seconds,
+                "rerun_seconds_max": self.rerun_seconds_max,
+                "spans": {
+                    name: {"calls": calls, "seconds": seconds, "max_seconds": worst}
+                    for name, (calls, seconds, worst) in sorted(self.spans.items())
+                },
+                "counters": dict(sorted(self.counters.items())),
+                "gauges": dict(sorted(self.gauges.items())),
+            }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        data = self.snapshot()
+        p = PROMETHEUS_PREFIX
+        lines = [
+            f"# TYPE {p}_uptime_seconds gauge",
+            f"{p}_uptime_seconds {data['uptime_seconds']:.3f}",
+            f"# TYPE {p}_rerun_seconds summary",
+            f"{p}_rerun_seconds_count {data['reruns']}",
+            f"{p}_rerun_seconds_sum {data['rerun_seconds']:.6f}",
+            f"# TYPE {p}_rerun_seconds_max gauge",
+            f"{p}_rerun_seconds_max {data['rerun_seconds_max']:.6f}",
+            f"# TYPE {p}_span_seconds summary",
+        ]
+        for name, span in data["spans"].items():
+            lines.append(f'{p}_span_seconds_count{{span="{_label(name)}"}} {span["calls"]}')
+            lines.append(f'{p}_span_seconds_sum{{span="{_label(name)}"}} {span["seconds"]:.6f}')
+        lines.append(f"# TYPE {p}_span_seconds_max gauge")
+        for name, span in data["spans"].items():
+            lines.append(f'{p}_span_seconds_max{{span="{_label(name)}"}} {span["max_seconds"]:.6f}')
+        for name, value in data["counters"].items():
+            lines += [f"# TYPE {p}_{name}_total counter", f"{p}_{name}_total {value}"]
+        for name, value in data["gauges"].items():
+            lines += [f"# TYPE {p}_{name} gauge", f"{p}_{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+
+def _label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def deep_size(obj):
+    # Approximate bytes held by obj and everything it references, each object once
+    seen = set()
+    stack = [obj]
+    size = 0
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+        elif hasattr(item, "__dict__"):
+            stack.append(vars(item))
+    return size
@@ -0,0 +1,70 @@
+"""Typed sale records.
+
+The database, the journal and the caches keep sales as plain dicts; these
+slotted dataclasses are what code building or reading a sale works with.
+``to_dict`` and ``from_dict`` convert between the two.
+"""
+
+from dataclasses import dataclass
+
+
+@dataclass(slots=True)
+class LineItem:
+    name: str
+    quantity: int
+    cost: float  # for the whole line, not per unit
+    sold: float
+
+    def to_dict(self):
+        return {"name": self.name, "quantity": self.quantity, "cost": self.cost, "sold": self.sold}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["name"], data["quantity"], data["cost"], data["sold"])
+
+
+@dataclass(slots=True)
+class Sale:
+    employee: str
+    store: str
+    date: str  # dates.DATE_FORMAT
+    type: str
+    products: list[LineItem]
+    cost: float
+    sold: float
+    acc: float
+    payment_method: str
+    uid: str | None = None
+    id: int | None = None
+
+    def to_dict(self):
+        sale = {
+            "employee": self.employee,
+            "store": self.store,
+            "date": self.date,
+            "type": self.type,
+            "products": [item.to_dict() for item in self.products],
+            "cost": self.cost,
+            "sold": self.sold,
+            "acc": self.acc,
+            "payment_method": self.payment_method,
+        }
+        if self.uid is not None:
+            sale["uid"] = self.uid
+        return sale
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            employee=data["employee"],
+            store=data["store"],
+            date=data["date"],
+            type=data["type"],
+            products=[LineItem.from_dict(item) for item in data["products"]],
+            cost=data["cost"],
+            sold=data["sold"],
+            acc=data["acc"],
+            payment_method=data["payment_method"],
+            uid=data.get("uid"),
+            id=data.get("id"),
+        )
@@ -0,0 +1,217 @@
+"""Offline-tolerant register: a local write-ahead queue synced to the central store.
+
+Checkout writes the sale and its stock decrement to a small SQLite file on
+the register, in one local transaction, so it never waits on the link to the
+central Database. A background thread sends queued sales to
+``Database.sync_sales`` in batches and drops each one once the central store
+has answered for it.
+
+Sales carry their uid from the moment they are queued, so a batch resent after
+a lost reply is recognised as a duplicate rather than recorded twice. A sale
+that the central stock can no longer cover (another register sold the last
+unit while this one was offline) is moved to a conflicts table for a manager
+to record or discard. After each sync the local stock is rebuilt from the
+central inventory minus whatever is still queued.
+"""
+
+import json
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+from .inventory import StockError, stock_needed
+from .records import LineItem, Sale
+
+# Failures that mean "central store unreachable, keep the sale queued"
+SYNC_ERRORS = (OSError, sqlite3.OperationalError)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    uid TEXT NOT NULL UNIQUE,
+    sale TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS stock (
+    store TEXT NOT NULL,
+    product TEXT NOT NULL,
+    qty INTEGER NOT NULL,
+    PRIMARY KEY (store, product)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS conflicts (
+    uid TEXT PRIMARY KEY,
+    sale TEXT NOT NULL,
+    reason TEXT NOT NULL,
+    at TEXT NOT NULL
+);
+"""
+
+_QUEUE_SALE = "INSERT INTO outbox (uid, sale) VALUES (?, ?)"
+_SELECT_BATCH = "SELECT uid, sale FROM outbox ORDER BY seq LIMIT ?"
+_SELECT_QUEUED = "SELECT sale FROM outbox"
+_COUNT_QUEUED = "SELECT COUNT(*) FROM outbox"
+_DEQUEUE = "DELETE FROM outbox WHERE uid = ?"
+_TAKE_STOCK = "UPDATE stock SET qty = qty - ? WHERE store = ? AND product = ? AND qty >= ?"
+_SELECT_QTY = "SELECT qty FROM stock WHERE store = ? AND product = ?"
+_SELECT_STOCK = "SELECT product, qty FROM stock WHERE store = ? ORDER BY product"
+_CLEAR_STOCK = "DELETE FROM stock WHERE store = ?"
+_SET_STOCK = "INSERT INTO stock (store, product, qty) VALUES (?, ?, ?)"
+_ADD_CONFLICT = "INSERT OR REPLACE INTO conflicts (uid, sale, reason, at) VALUES (?, ?, ?, ?)"
+_SELECT_CONFLICTS = "SELECT * FROM conflicts ORDER BY at"
+_SELECT_CONFLICT = "SELECT sale FROM conflicts WHERE uid = ?"
+_COUNT_CONFLICTS = "SELECT COUNT(*) FROM conflicts"
+_DELETE_CONFLICT = "DELETE FROM conflicts WHERE uid = ?"
+
+
+class OfflineRegister:
+    """Queues checkouts locally and syncs them to ``central`` in the background.
+
+    ``central`` is the shared Database, or anything with the same
+    ``sync_sales``, ``store_inventory`` and ``add_sale`` methods.
+    """
+
+    def __init__(self, central, path, stores, batch_size=200, sync_interval=5.0):
+        self.central = central
+        self.path = path
+        self.stores = list(stores)
+        self.batch_size = batch_size
+        self.sync_interval = sync_interval
+        self.last_sync = None
+        self.last_error = None
+
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._syncing = threading.Lock()
+
+        self._wake = threading.Event()
+        self._closed = threading.Event()
+        self._syncer = threading.Thread(target=self._sync_loop, name="register-sync", daemon=True)
+        self._syncer.start()
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    # ---------- Register side ----------
+    def checkout(self, sale):
+        # Takes the lines from local stock and queues the sale; raises
+        # StockError and queues nothing if the local stock falls short
+        sale = sale.to_dict() if isinstance(sale, Sale) else dict(sale)
+        sale.pop("id", None)
+        sale.setdefault("uid", uuid.uuid4().hex)
+        store = sale["store"]
+        with self._transaction() as conn:
+            for name, qty in stock_needed(_line_items(sale)).items():
+                if conn.execute(_TAKE_STOCK, (qty, store, name, qty)).rowcount == 0:
+                    row = conn.execute(_SELECT_QTY, (store, name)).fetchone()
+                    raise StockError(store, name, None if row is None else row["qty"])
+            conn.execute(_QUEUE_SALE, (sale["uid"], json.dumps(sale, separators=(",", ":"))))
+        self._wake.set()
+        return sale["uid"]
+
+    def stock(self, store):
+        # The register's view: central stock at the last sync less queued sales
+        with self._lock:
+            return {row["product"]: row["qty"] for row in self._conn.execute(_SELECT_STOCK, (store,))}
+
+    def status(self):
+        with self._lock:
+            pending = self._conn.execute(_COUNT_QUEUED).fetchone()[0]
+            conflicts = self._conn.execute(_COUNT_CONFLICTS).fetchone()[0]
+        return {"pending": pending, "conflicts": conflicts, "last_sync": self.last_sync, "last_error": self.last_error}
+
+    # ---------- Sync ----------
+    def _sync_loop(self):
+        # Anything sync() lets through (a bad reply, a bug) is recorded and
+        # retried next round; the thread must outlive it or the queue stops
+        # draining for good
+        while not self._closed.is_set():
+            try:
+                self.sync()
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+            self._wake.wait(self.sync_interval)
+            self._wake.clear()
+
+    def sync(self):
+        # Sends the queue in batches, then refreshes local stock; returns False
+        # (and keeps everything still queued) if the central store is unreachable
+        with self._syncing:
+            try:
+                while True:
+                    with self._lock:
+                        batch = self._conn.execute(_SELECT_BATCH, (self.batch_size,)).fetchall()
+                    if not batch:
+                        break
+                    results = self.central.sync_sales([json.loads(row["sale"]) for row in batch])
+                    self._settle(batch, results)
+                inventories = {store: self.central.store_inventory(store) for store in self.stores}
+            except SYNC_ERRORS as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                return False
+            self._refresh_stock(inventories)
+            self.last_sync = datetime.now()
+            self.last_error = None
+            return True
+
+    def _settle(self, batch, results):
+        at = datetime.now().isoformat(timespec="seconds")
+        with self._transaction() as conn:
+            for row in batch:
+                status, message = results[row["uid"]]
+                if status == "oversold":
+                    conn.execute(_ADD_CONFLICT, (row["uid"], row["sale"], message, at))
+                conn.execute(_DEQUEUE, (row["uid"],))
+
+    def _refresh_stock(self, inventories):
+        # Sales queued while the inventory was being fetched are taken off here
+        with self._transaction() as conn:
+            queued = [json.loads(row["sale"]) for row in conn.execute(_SELECT_QUEUED)]
+            for store, inventory in inventories.items():
+                needed = stock_needed(item for sale in queued if sale["store"] == store for item in _line_items(sale))
+                conn.execute(_CLEAR_STOCK, (store,))
+                conn.executemany(
+                    _SET_STOCK,
+                    [(store, product, qty - needed.get(product, 0)) for product, qty in inventory.items()],
+                )
+
+    # ---------- Conflicts ----------
+    def conflicts(self):
+        with self._lock:
+            return [
+                {"uid": row["uid"], "sale": json.loads(row["sale"]), "reason": row["reason"], "at": row["at"]}
+                for row in self._conn.execute(_SELECT_CONFLICTS)
+            ]
+
+    def resolve(self, uid, record):
+        # record=True keeps the sale (it happened) without touching stock, which
+        # a manager corrects by hand; record=False discards it
+        with self._lock:
+            row = self._conn.execute(_SELECT_CONFLICT, (uid,)).fetchone()
+        if row is None:
+            return
+        if record:
+            self.central.add_sale(json.loads(row["sale"]))
+        with self._transaction() as conn:
+            conn.execute(_DELETE_CONFLICT, (uid,))
+
+    def close(self):
+        self._closed.set()
+        self._wake.set()
+        self._syncer.join()
+        self._conn.close()
+
+
+def _line_items(sale):
+    return [LineItem.from_dict(item) for item in sale["products"]]
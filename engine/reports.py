@@ -0,0 +1,44 @@
+"""Report shaping as pure functions over Sale records and totals dicts."""
+
+
+def sale_rows(sales):
+    # One display row per sale, produced lazily
+    for sale in sales:
+        yield {
+            "Employee": sale.employee,
+            "Store": sale.store,
+            "Date": sale.date,
+            "Type": sale.type,
+            "Products": ", ".join(f"{item.name} (x{item.quantity})" for item in sale.products),
+            "Cost": sale.cost,
+            "Sold": sale.sold,
+            "Profit": sale.acc,
+            "Payment": sale.payment_method,
+        }
+
+
+def product_rows(groups):
+    # SalesLedger.group_totals("product") output as display rows, best sellers first
+    for name, totals in sorted(groups.items(), key=lambda item: -item[1]["sold"]):
+        yield {
+            "Product": name,
+            "Units": int(totals["quantity"]),
+            "Cost": f"${totals['cost']:.2f}",
+            "Sold": f"${totals['sold']:.2f}",
+            "Profit": f"${totals['sold'] - totals['cost']:.2f}",
+        }
+
+
+def period_rows(buckets, field, stores):
+    # Database.bucket_totals output as one row per period, a column per store
+    # and a total; `field` is a totals key such as "sold" or "count"
+    rows = {}
+    for (label, store), totals in sorted(buckets.items()):
+        row = rows.setdefault(label, {"Period": label, **{s: 0.0 for s in stores}, "Total": 0.0})
+        row[store] = row.get(store, 0.0) + totals[field]
+        row["Total"] += totals[field]
+    for row in rows.values():
+        yield {
+            key: value if key == "Period" else (f"{value:.0f}" if field == "count" else f"${value:.2f}")
+            for key, value in row.items()
+        }
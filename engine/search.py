@@ -0,0 +1,64 @@
+"""Product-name search for the Add Sale picker.
+
+Names are indexed two ways: a sorted list of (word, name) pairs answers
+prefix queries with bisect, and a trigram -> names map answers substring and
+typo-tolerant queries by counting shared trigrams. A query only touches the
+names that share a prefix or trigram with it, never the whole catalog.
+"""
+
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+
+def _trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class CatalogIndex:
+    def __init__(self, names):
+        self.names = sorted(names)
+        self._words = sorted(
+            (word, name) for name in self.names for word in name.lower().split()
+        )
+        self._grams = defaultdict(set)
+        for name in self.names:
+            for gram in _trigrams(name.lower()):
+                self._grams[gram].add(name)
+
+    def __len__(self):
+        return len(self.names)
+
+    def _prefix(self, prefix):
+        found = []
+        i = bisect_left(self._words, (prefix,))
+        while i < len(self._words) and self._words[i][0].startswith(prefix):
+            found.append(self._words[i][1])
+            i += 1
+        return found
+
+    def search(self, query, limit=10):
+        query = " ".join(query.lower().split())
+        if not query:
+            return []
+        # 1. every query word is the start of a word in the name
+        words = query.split()
+        matches = set(self._prefix(words[0]))
+        for word in words[1:]:
+            matches &= set(self._prefix(word))
+        ranked = sorted(matches)
+        if len(ranked) >= limit:
+            return ranked[:limit]
+
+        # 2. substring or near miss: rank by shared trigrams
+        grams = _trigrams(query)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._grams.get(gram, ()))
+        threshold = max(2, len(grams) // 2)
+        for name, count in sorted(shared.items(), key=lambda item: (-item[1], item[0])):
+            if count < threshold or len(ranked) >= limit:
+                break
+            if name not in matches:
+                ranked.append(name)
+        return ranked
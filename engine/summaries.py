@@ -0,0 +1,227 @@
+"""Materialized daily summaries for date-range reports.
+
+Once a day is closed (it is before today), its sales are compacted into
+daily_summaries: one row per day for all stores plus one per store and per
+employee that sold that day. Those rows are never updated in place. A write
+that touches a closed day's sales deletes the day's rows in its own
+transaction, and the SummaryWorker rebuilds them in the background.
+
+A range report adds up the summary rows for the closed days it covers and
+scans raw sales only for what is not compacted yet, which is normally just
+today. Day, week, month and year reports group the same rows by bucket, so
+their cost follows the number of days in the range, not the number of sales.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+from .changes import SALES
+from .dates import day_key, to_timestamp
+from .totals import TOTAL_FIELDS, empty_totals
+
+# Summary dimension -> sales column it groups by
+SUMMARY_COLUMNS = {"all": "''", "store": "store", "employee": "employee"}
+
+# Report bucket -> SQL expression turning a YYYY-MM-DD day into its label
+BUCKETS = {
+    "day": "day",
+    "week": "date(day, '-6 days', 'weekday 1')",  # the Monday the week starts on
+    "month": "substr(day, 1, 7)",
+    "year": "substr(day, 1, 4)",
+}
+
+_AGGREGATES = (
+    "COUNT(*) AS count, TOTAL(cost) AS cost, TOTAL(sold) AS sold, TOTAL(acc) AS acc, "
+    "TOTAL(CASE WHEN payment_method = 'Cash' THEN sold END) AS cash, "
+    "TOTAL(CASE WHEN payment_method = 'Card' THEN sold END) AS card"
+)
+_SUMMED = (
+    "TOTAL(count) AS count, TOTAL(cost) AS cost, TOTAL(sold) AS sold, "
+    "TOTAL(acc) AS acc, TOTAL(cash) AS cash, TOTAL(card) AS card"
+)
+_COMPACT = (
+    "INSERT INTO daily_summaries (day, dim, key, count, cost, sold, acc, cash, card) "
+    f"SELECT ?, ?, {{column}}, {_AGGREGATES} FROM sales WHERE ts >= ? AND ts < ? GROUP BY 3"
+)
+# Days without sales still get an "all" row, which marks them as compacted
+_MARK_COMPACTED = (
+    "INSERT OR IGNORE INTO daily_summaries (day, dim, key, count, cost, sold, acc, cash, card) "
+    "VALUES (?, 'all', '', 0, 0.0, 0.0, 0.0, 0.0, 0.0)"
+)
+_DELETE_DAY = "DELETE FROM daily_summaries WHERE day = ?"
+_SELECT_FIRST_TS = "SELECT MIN(ts) FROM sales"
+_SELECT_COMPACTED = (
+    "SELECT day FROM daily_summaries WHERE dim = 'all' AND key = '' AND day >= ? AND day < ?"
+)
+_SUM_SUMMARIES = f"SELECT {_SUMMED} FROM daily_summaries WHERE dim = ? AND key = ? AND day >= ? AND day < ?"
+_BUCKET_SUMMARIES = (
+    f"SELECT {{bucket}} AS bucket, key, {_SUMMED} FROM daily_summaries "
+    "WHERE dim = ? AND day >= ? AND day < ? GROUP BY 1, 2"
+)
+_BUCKET_SALES = (
+    f"SELECT {{bucket}} AS bucket, key, {_AGGREGATES} FROM ("
+    "SELECT date(ts, 'unixepoch') AS day, {column} AS key, cost, sold, acc, payment_method "
+    "FROM sales WHERE ts >= ? AND ts < ?"
+    ") GROUP BY 1, 2"
+)
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _day_bounds(day):
+    start = datetime.combine(day, datetime.min.time())
+    return to_timestamp(start), to_timestamp(start + timedelta(days=1))
+
+
+def _days(start, end):
+    day = start
+    while day < end:
+        yield day
+        day += timedelta(days=1)
+
+
+# ---------- Writing ----------
+def invalidate(conn, sale):
+    # Called for every sale a write adds or removes; a no-op for today's sales
+    conn.execute(_DELETE_DAY, (day_key(sale["date"]),))
+
+
+def missing_days(conn, today):
+    # Closed days, from the first sale on, that have no summary rows yet
+    first = conn.execute(_SELECT_FIRST_TS).fetchone()[0]
+    if first is None:
+        return []
+    first_day = (_EPOCH + timedelta(seconds=first)).date()
+    compacted = {
+        row[0] for row in conn.execute(_SELECT_COMPACTED, (first_day.isoformat(), today.isoformat()))
+    }
+    return [day for day in _days(first_day, today) if day.isoformat() not in compacted]
+
+
+def compact_day(conn, day):
+    # Rebuilds one closed day's rows from its sales; safe to repeat
+    key = day.isoformat()
+    start, end = _day_bounds(day)
+    conn.execute(_DELETE_DAY, (key,))
+    for dim, column in SUMMARY_COLUMNS.items():
+        conn.execute(_COMPACT.format(column=column), (key, dim, start, end))
+    conn.execute(_MARK_COMPACTED, (key,))
+
+
+# ---------- Reading ----------
+def range_totals(conn, start, end, today, dim="all", key=""):
+    # Totals for sales on days start <= day < end. Returns (totals, pending),
+    # where pending is how many closed days had to be read from raw sales
+    # because they were not compacted yet.
+    closed_end = min(end, today)
+    compacted = _compacted(conn, start, closed_end)
+    totals = _row_totals(conn.execute(
+        _SUM_SUMMARIES, (dim, key, start.isoformat(), closed_end.isoformat())
+    ).fetchone())
+
+    pending = 0
+    for span_start, span_end in _uncompacted_spans(start, end, compacted):
+        if span_start < today:
+            pending += (min(span_end, today) - span_start).days
+        _add(totals, live_totals(conn, span_start, span_end, dim, key))
+    return totals, pending
+
+
+def bucket_totals(conn, start, end, today, bucket="day", dim="store"):
+    # {(bucket label, key): totals} for days start <= day < end, e.g. one
+    # entry per month and store. Same split as range_totals: summary rows
+    # for compacted days, raw sales only for the rest.
+    closed_end = min(end, today)
+    compacted = _compacted(conn, start, closed_end)
+    results = {}
+    rows = conn.execute(
+        _BUCKET_SUMMARIES.format(bucket=BUCKETS[bucket]), (dim, start.isoformat(), closed_end.isoformat())
+    )
+    for row in rows:
+        _add(results.setdefault((row["bucket"], row["key"]), empty_totals()), _row_totals(row))
+
+    for span_start, span_end in _uncompacted_spans(start, end, compacted):
+        rows = conn.execute(
+            _BUCKET_SALES.format(bucket=BUCKETS[bucket], column=SUMMARY_COLUMNS[dim]),
+            (_day_bounds(span_start)[0], _day_bounds(span_end)[0]),
+        )
+        for row in rows:
+            _add(results.setdefault((row["bucket"], row["key"]), empty_totals()), _row_totals(row))
+    return results
+
+
+def _compacted(conn, start, end):
+    return {row[0] for row in conn.execute(_SELECT_COMPACTED, (start.isoformat(), end.isoformat()))}
+
+
+def _row_totals(row):
+    totals = {field: row[field] for field in TOTAL_FIELDS}
+    totals["count"] = int(row["count"])
+    return totals
+
+
+def _add(totals, more):
+    for field in totals:
+        totals[field] += more[field]
+
+
+def _uncompacted_spans(start, end, compacted):
+    # Merges consecutive days without summary rows into [start, end) spans
+    span_start = None
+    for day in _days(start, end):
+        if day.isoformat() in compacted:
+            if span_start is not None:
+                yield span_start, day
+                span_start = None
+        elif span_start is None:
+            span_start = day
+    if span_start is not None:
+        yield span_start, end
+
+
+def live_totals(conn, start, end, dim="all", key=""):
+    # Straight from raw sales, through the (ts) or (store, ts) / (employee, ts) index
+    sql = f"SELECT {_AGGREGATES} FROM sales WHERE ts >= ? AND ts < ?"
+    params = [_day_bounds(start)[0], _day_bounds(end)[0]]
+    if dim != "all":
+        sql += f" AND {SUMMARY_COLUMNS[dim]} = ?"
+        params.append(key)
+    return _row_totals(conn.execute(sql, params).fetchone())
+
+
+# ---------- Background worker ----------
+class SummaryWorker:
+    """Compacts closed days on a background thread whenever sales change.
+
+    Requests are coalesced: however many writes arrive while a pass is
+    queued, only one more pass runs.
+    """
+
+    def __init__(self, database):
+        self._database = database
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="summaries")
+        self._lock = threading.Lock()
+        self._queued = False
+        self._unsubscribe = database.changes.subscribe(self._on_change)
+        self.request()
+
+    def _on_change(self, topic, store):
+        if topic == SALES:
+            self.request()
+
+    def request(self):
+        with self._lock:
+            if self._queued:
+                return
+            self._queued = True
+        self._executor.submit(self._run)
+
+    def _run(self):
+        with self._lock:
+            self._queued = False
+        self._database.compact_summaries(date.today())
+
+    def close(self):
+        self._unsubscribe()
+        self._executor.shutdown(wait=True)
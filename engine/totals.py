@@ -0,0 +1,57 @@
+"""Running sales totals, kept in the sale_totals table.
+
+Every sale contributes to one row per dimension below. Appending, deleting or
+modifying a sale adjusts those few rows in the same transaction, so reports
+read precomputed numbers instead of rescanning the sales history.
+"""
+
+from .dates import day_key
+
+DIMENSIONS = ("all", "store", "employee", "day", "payment")
+
+TOTAL_FIELDS = ("cost", "sold", "acc", "cash", "card")
+
+_BUMP = (
+    "INSERT INTO sale_totals (dim, key, count, cost, sold, acc, cash, card) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT (dim, key) DO UPDATE SET "
+    "count = count + excluded.count, cost = cost + excluded.cost, "
+    "sold = sold + excluded.sold, acc = acc + excluded.acc, "
+    "cash = cash + excluded.cash, card = card + excluded.card"
+)
+_SELECT_ONE = "SELECT * FROM sale_totals WHERE dim = ? AND key = ?"
+
+
+def sale_keys(sale):
+    return (
+        ("all", ""),
+        ("store", sale["store"]),
+        ("employee", sale["employee"]),
+        ("day", day_key(sale["date"])),
+        ("payment", sale["payment_method"]),
+    )
+
+
+def apply_sale(conn, sale, sign=1):
+    # sign=1 adds a sale to every total it belongs to, sign=-1 takes it back out
+    cash = sale["sold"] if sale["payment_method"] == "Cash" else 0.0
+    card = sale["sold"] if sale["payment_method"] == "Card" else 0.0
+    amounts = (sign, sign * sale["cost"], sign * sale["sold"], sign * sale["acc"], sign * cash, sign * card)
+    conn.executemany(_BUMP, [(dim, key, *amounts) for dim, key in sale_keys(sale)])
+
+
+def empty_totals():
+    totals = {field: 0.0 for field in TOTAL_FIELDS}
+    totals["count"] = 0
+    return totals
+
+
+def _totals_from_row(row):
+    totals = {field: row[field] for field in TOTAL_FIELDS}
+    totals["count"] = row["count"]
+    return totals
+
+
+def read_totals(conn, dim, key=""):
+    row = conn.execute(_SELECT_ONE, (dim, key)).fetchone()
+    return empty_totals() if row is None else _totals_from_row(row)
@@ -0,0 +1,100 @@
+"""Sales velocity per product and store, kept in the sku_velocity table.
+
+Each (store, SKU) row holds an exponentially decayed count of units sold and
+the timestamp that count is as of. Recording a sale decays the row to the
+sale's time and adds the units; a sale dated before the row's timestamp
+adds its units already decayed instead. Both steps are linear, so taking a
+sale back out subtracts exactly what it added and edits or deletes need no
+rescan.
+
+The decayed count divided by WINDOW_DAYS is the current rate in units per
+day (a steady seller converges to its true daily rate), so days of cover and
+reorder quantities cost one row per product, whatever the sales history.
+"""
+
+import math
+
+# Time constant of the decay: a unit sold WINDOW_DAYS ago counts for ~37% of
+# one sold now, so the rate follows roughly the last few weeks of sales.
+WINDOW_DAYS = 14
+# Alert when stock would run out in fewer days than a reorder takes to arrive
+LEAD_DAYS = 7
+# Suggested orders bring stock up to this many days of sales
+TARGET_DAYS = 30
+
+_WINDOW_SECONDS = WINDOW_DAYS * 86400
+# Older sales add less than 0.04% of their units; the backfill skips them
+_BACKFILL_DAYS = 8 * WINDOW_DAYS
+# Rounding residue left when the same sales are added and taken back out
+_RESIDUE = 1e-6
+
+_SELECT_LINES = (
+    "SELECT sku_id, SUM(quantity) AS quantity FROM sale_items "
+    "WHERE sale_id = ? AND sku_id IS NOT NULL GROUP BY sku_id"
+)
+_SELECT_ONE = "SELECT units, ts FROM sku_velocity WHERE store = ? AND sku_id = ?"
+_UPSERT = (
+    "INSERT INTO sku_velocity (store, sku_id, units, ts) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT (store, sku_id) DO UPDATE SET units = excluded.units, ts = excluded.ts"
+)
+_SELECT_RECENT = "SELECT id, store, ts FROM sales WHERE ts >= ? ORDER BY ts"
+_SELECT_STORE = (
+    "SELECT k.name AS product, i.qty, v.units, v.ts FROM inventory i JOIN skus k ON k.id = i.sku_id "
+    "LEFT JOIN sku_velocity v ON v.store = i.store AND v.sku_id = i.sku_id "
+    "WHERE i.store = ? ORDER BY k.name"
+)
+
+
+def _decayed(units, since, now):
+    # `units` as of `since`, decayed to `now`; never grows for a `now` before `since`
+    if now <= since:
+        return units
+    return units * math.exp((since - now) / _WINDOW_SECONDS)
+
+
+def apply_sale(conn, sale_id, store, ts, sign=1):
+    # sign=1 adds the catalog lines of an inserted sale, sign=-1 takes them back
+    # out; call before its sale_items rows are deleted. Custom items have no SKU.
+    for line in conn.execute(_SELECT_LINES, (sale_id,)).fetchall():
+        row = conn.execute(_SELECT_ONE, (store, line["sku_id"])).fetchone()
+        units, since = (0.0, ts) if row is None else (row["units"], row["ts"])
+        if ts >= since:
+            units, since = _decayed(units, since, ts) + sign * line["quantity"], ts
+        else:
+            units += sign * _decayed(line["quantity"], ts, since)
+        conn.execute(_UPSERT, (store, line["sku_id"], units, since))
+
+
+def backfill(conn, now):
+    # Seed sku_velocity from recent sales, once, when the table is created
+    for row in conn.execute(_SELECT_RECENT, (now - _BACKFILL_DAYS * 86400,)).fetchall():
+        apply_sale(conn, row["id"], row["store"], row["ts"])
+
+
+def outlook(product, qty, units, since, now, lead_days=LEAD_DAYS, target_days=TARGET_DAYS):
+    # Rate, cover and reorder suggestion for one product from its velocity row;
+    # `units` and `since` are None for a product that has never sold.
+    units = 0.0 if units is None else _decayed(units, since, now)
+    daily = units / WINDOW_DAYS if units > _RESIDUE else 0.0
+    cover = qty / daily if daily > 0 else None
+    low = cover is not None and cover < lead_days
+    return {
+        "product": product,
+        "qty": qty,
+        "daily_units": daily,
+        "days_of_cover": cover,
+        "low": low,
+        "reorder_qty": max(math.ceil(daily * target_days) - qty, 0) if low else 0,
+    }
+
+
+def low_stock(outlooks):
+    # The flagged rows of stock_outlook output, the soonest to run out first
+    return sorted((row for row in outlooks if row["low"]), key=lambda row: row["days_of_cover"])
+
+
+def store_outlook(conn, store, now, lead_days=LEAD_DAYS, target_days=TARGET_DAYS):
+    return [
+        outlook(row["product"], row["qty"], row["units"], row["ts"], now, lead_days, target_days)
+        for row in conn.execute(_SELECT_STORE, (store,))
+    ]
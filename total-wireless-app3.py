@@ -1,83 +1,436 @@
+import io
+import json
+import os
+import threading
+import time
+
 import streamlit as st
-from datetime import datetime
+from datetime import date, datetime, timedelta
+
+# The engine holds all business logic; this file only draws it. Python imports
+# it once per process, and the Database below is shared across sessions.
+from engine import CATALOG, CLOSES, INVENTORY, PRODUCTS, SALES, CatalogError, Database, LineItem, OfflineRegister, Sale, StockError
+from engine.bulk import iter_sales_csv, iter_upload_rows, parse_inventory
+from engine.checkout import build_sale, line_item, sale_problems
+from engine.inventory import catalog_edits, stock_shortfalls
+from engine.metrics import Metrics, RerunProfile, deep_size
+from engine.reports import period_rows, product_rows, sale_rows
+from engine.search import CatalogIndex
+from engine.velocity import LEAD_DAYS, TARGET_DAYS, low_stock
 
 # ---------- Constants ----------
-STORE_LOCATIONS = [
-    "1 E Penn Sq",
-    "5600 Germantown Ave",
-    "2644 Germantown Ave"
-]
+# Store list and admin logins come from this JSON file when it exists, e.g.
+# {"stores": ["1 E Penn Sq", ...], "admin_credentials": {"admin": "..."}}
+CONFIG_PATH = os.environ.get(
+    "TW_CONFIG",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "total_wireless.json"),
+)
+
+DEFAULT_CONFIG = {
+    "stores": [
+        "1 E Penn Sq",
+        "5600 Germantown Ave",
+        "2644 Germantown Ave"
+    ],
+    "admin_credentials": {"admin": "1234"},  # Change this password
+}
+
+@st.cache_resource
+def load_config(path, mtime):
+    # Read once per process and shared by every session; `mtime` makes an
+    # edited file load again on the next rerun. Must not be mutated.
+    config = dict(DEFAULT_CONFIG)
+    if mtime is not None:
+        with open(path, encoding="utf-8") as f:
+            config.update(json.load(f))
+    return config
+
+def config_mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+config = load_config(CONFIG_PATH, config_mtime(CONFIG_PATH))
+STORE_LOCATIONS = config["stores"]
+ADMIN_CREDENTIALS = config["admin_credentials"]
+
+DB_PATH = os.environ.get(
+    "TW_DB_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "total_wireless.db"),
+)
+
+# Append-only event journal (audit trail + recovery) and its snapshots
+JOURNAL_DIR = os.environ.get("TW_JOURNAL_DIR", DB_PATH + ".journal")
+
+# Register mode: set to a local file and Add Sale checkouts queue there first,
+# syncing to the database in the background, so sales go on if the link drops
+REGISTER_QUEUE = os.environ.get("TW_REGISTER_QUEUE")
+
+# ---------- Diagnostics ----------
+# Process-wide metrics, plus a profile of this rerun: one span per menu branch
+# and per helper call below. Admins see both under "Diagnostics".
+@st.cache_resource
+def open_metrics():
+    return Metrics()
+
+metrics = open_metrics()
+
+def start_profile():
+    previous = st.session_state.get("rerun_profile")
+    if previous is not None:
+        if not previous.finished:
+            # That rerun ended early (st.stop, a rerun or an error); count it up to here
+            metrics.record(previous.finish())
+        st.session_state["last_rerun_profile"] = previous
+    st.session_state["rerun_profile"] = RerunProfile()
+    return st.session_state["rerun_profile"]
+
+def count_widgets():
+    # Widgets registered so far this rerun, read from Streamlit's run context;
+    # None where this Streamlit version keeps it elsewhere
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+    except ImportError:
+        return None
+    ctx = get_script_run_ctx()
+    ids = getattr(getattr(ctx, "shared", ctx), "widget_ids_this_run", None)
+    if ids is None:
+        return None
+    return len(ids.snapshot() if hasattr(ids, "snapshot") else ids)
+
+def finish_profile():
+    widgets = count_widgets()
+    if widgets is not None:
+        profile.gauge("rerun_widgets", widgets)
+    state = {k: v for k, v in st.session_state.items() if k not in ("rerun_profile", "last_rerun_profile")}
+    profile.gauge("session_state_bytes", deep_size(state))
+    metrics.record(profile.finish())
+
+profile = start_profile()
 
-ADMIN_CREDENTIALS = {"admin": "1234"}  # Change this password
+# ---------- Streamlit App Setup ----------
+st.set_page_config(page_title="Total Wireless App", layout="wide")
+st.title("📱 Total Wireless Sales & Inventory App by PBarua")
 
-# ---------- Session State Initialization ----------
-if 'sales' not in st.session_state:
-    st.session_state.sales = []
+# ---------- Employee Login ----------
+# Drawn before the database opens, so a cold process shows the login at once;
+# the storage below loads while the user types.
+st.sidebar.header("🔑 Login")
+employee = st.sidebar.text_input("Employee Name", "").strip()
+password = st.sidebar.text_input("Password", type="password")
 
-if 'inventory' not in st.session_state:
-    st.session_state.inventory = {store: {} for store in STORE_LOCATIONS}
+is_admin = employee in ADMIN_CREDENTIALS and password == ADMIN_CREDENTIALS.get(employee, "")
 
-if 'products' not in st.session_state:
-    # products dict: store -> product -> {"cost": float}
-    st.session_state.products = {store: {} for store in STORE_LOCATIONS}
+# ---------- Storage ----------
+# One Database per server process, shared by every session and register.
+# Writes touch only the changed rows and bump per-store versions in db.changes.
+@st.cache_resource
+def open_database(path, journal_dir):
+    return Database(path, journal_dir=journal_dir)
+
+@st.cache_resource
+def open_register(path, _central):
+    return OfflineRegister(_central, path, STORE_LOCATIONS)
+
+with profile.span("open_database"):
+    db = open_database(DB_PATH, JOURNAL_DIR)
+    register = open_register(REGISTER_QUEUE, db) if REGISTER_QUEUE else None
+
+# Per-store catalog and stock reads, shared by every session through db.cache
+def cached_inventory(store):
+    # Reloaded only after a write to this store's inventory
+    return db.cache.get(INVENTORY, store, lambda: db.store_inventory(store))
+
+def cached_products(store):
+    return db.cache.get(PRODUCTS, store, lambda: db.store_products(store))
+
+def cached_catalog_index(store):
+    # Rebuilt only when this store's products change
+    return db.cache.get(PRODUCTS, store, lambda: CatalogIndex(cached_products(store)), key="search")
+
+def cached_global_index():
+    # Every product name in the catalog, for products a store has never carried;
+    # rebuilt only when a name is added or renamed
+    return db.cache.get(CATALOG, None, lambda: CatalogIndex(db.product_names()), key="search")
+
+@st.cache_resource
+def warm_caches(stores):
+    # The first session of a process starts this once, in the background, and
+    # carries on rendering; later sessions find every store's catalog, search
+    # index and stock already loaded
+    def warm():
+        for store in stores:
+            cached_catalog_index(store)
+            cached_inventory(store)
+
+    thread = threading.Thread(target=warm, name="warm-caches", daemon=True)
+    thread.start()
+    return thread
+
+warm_caches(tuple(STORE_LOCATIONS))
 
 # ---------- Helper Functions ----------
-def load_sales():
-    return st.session_state.sales
-
+@profile.timed
 def save_sales(sales):
-    st.session_state.sales = sales
+    db.replace_sales(sales)
 
-def load_inventory():
-    return st.session_state.inventory
+@profile.timed
+def add_sale(sale):
+    return db.add_sale(sale)
 
-def save_inventory(inventory):
-    st.session_state.inventory = inventory
+@profile.timed
+def update_sale(uid, sale):
+    db.update_sale(uid, sale)
 
-def load_products():
-    return st.session_state.products
+@profile.timed
+def delete_sale(uid):
+    db.delete_sale(uid)
 
-def save_products(products):
-    st.session_state.products = products
+@profile.timed
+def load_inventory(store):
+    return cached_inventory(store)
 
-def reduce_inventory(store, product, qty):
-    inventory = load_inventory()
-    if store not in inventory or product not in inventory[store]:
-        st.error(f"Product '{product}' not found in inventory at {store}.")
-        return False
-    if inventory[store][product] < qty:
-        st.error(f"Not enough stock for '{product}'. Available: {inventory[store][product]}")
+@profile.timed
+def save_inventory(inventory):
+    db.replace_inventory(inventory)
+
+@profile.timed
+def add_stock(store, product, qty):
+    return db.add_stock(store, product, qty)
+
+@profile.timed
+def search_catalog(query, limit=10):
+    return cached_global_index().search(query, limit)
+
+@profile.timed
+def load_availability(product):
+    # {store: qty} wherever the product is in stock; one indexed lookup
+    return db.availability(product)
+
+@profile.timed
+def transfer_stock(product, from_store, to_store, qty, moved_by):
+    # Debit, credit and the transfer record commit together
+    try:
+        return db.transfer_stock(product, from_store, to_store, qty, moved_by)
+    except (StockError, CatalogError, ValueError) as e:
+        st.error(str(e))
+        return None
+
+@profile.timed
+def load_transfers(store):
+    return db.cache.get(INVENTORY, store, lambda: db.transfers(store), key="transfers")
+
+@profile.timed
+def load_stock_outlook(store):
+    # Sales rate, days of cover and reorder suggestion per product; one stored
+    # velocity row each, so this is not cached and always reflects the clock
+    return db.stock_outlook(store)
+
+@profile.timed
+def search_products(store, query, limit=10):
+    return cached_catalog_index(store).search(query, limit)
+
+@profile.timed
+def import_inventory(items):
+    # One transaction for every row of an uploaded file
+    try:
+        db.bulk_import(items)
+    except CatalogError as e:
+        st.error(str(e))
         return False
-    inventory[store][product] -= qty
-    save_inventory(inventory)
     return True
 
-def calculate_totals(sales):
-    return {
-        "cost": sum(s["cost"] for s in sales),
-        "sold": sum(s["sold"] for s in sales),
-        "acc": sum(s["acc"] for s in sales),
-        "cash": sum(s["sold"] for s in sales if s["payment_method"] == "Cash"),
-        "card": sum(s["sold"] for s in sales if s["payment_method"] == "Card")
+def priced_products():
+    # (store, product) pairs that already have a cost price
+    return {(s, product) for s in STORE_LOCATIONS for product in load_products(s)}
+
+@profile.timed
+def load_products(store):
+    return cached_products(store)
+
+@profile.timed
+def save_products(products):
+    db.replace_products(products)
+
+@profile.timed
+def set_product_cost(store, product, cost):
+    db.set_product_cost(store, product, cost)
+
+def save_product_edits(store, current, editor_key):
+    # Form submit callback: the whole batch is one write, made before the
+    # rerun draws the page, so the grid comes back already up to date
+    costs, renames, deletes = catalog_edits(current, st.session_state[editor_key]["edited_rows"])
+    if not (costs or renames or deletes):
+        st.session_state["product_edit_result"] = ("info", "No changes to save.")
+        return
+    # A rename is of the SKU itself, so it reaches every store carrying it
+    shared = sorted({old for old, _ in renames if any(old in load_products(s) for s in STORE_LOCATIONS if s != store)})
+    if shared and not st.session_state.get("confirm_shared_rename"):
+        st.session_state["product_edit_result"] = (
+            "error",
+            f"Other stores carry {', '.join(shared)}; tick \"Rename in every store\" to rename across all stores. Nothing was saved.",
+        )
+        return
+    started = time.perf_counter()
+    try:
+        changed = db.edit_products(store, costs, renames, deletes)
+    except CatalogError as e:
+        st.session_state["product_edit_result"] = ("error", str(e))
+        return
+    elapsed = (time.perf_counter() - started) * 1000
+    st.session_state["confirm_shared_rename"] = False
+    st.session_state["product_edit_result"] = ("success", f"Saved {changed} changed product(s) in {elapsed:.1f} ms.")
+
+@profile.timed
+def record_sale(sale):
+    # Checks and decrements every line, then appends the sale, as one transaction;
+    # in register mode that transaction is on the local queue
+    try:
+        return register.checkout(sale) if register else db.checkout(sale)
+    except StockError as e:
+        st.error(str(e))
+        return None
+
+@profile.timed
+def load_register_stock(store):
+    # What Add Sale may sell: the register's local view in register mode
+    return register.stock(store) if register else load_inventory(store)
+
+@profile.timed
+def list_employees():
+    return db.employees()
+
+@profile.timed
+def load_totals(dim="all", key=""):
+    # Running totals kept up to date on every sale write; never rescans sales
+    store = key if dim == "store" else None
+    return db.cache.get(SALES, store, lambda: db.totals(dim, key), key=("totals", dim, key))
+
+@profile.timed
+def load_period_totals(start, end, dim="all", key=""):
+    # Days start <= day < end; closed days are read from the daily summaries a
+    # background worker keeps compacted, so only today's sales are summed live
+    if start is None:
+        return load_totals(dim, key)
+    store = key if dim == "store" else None
+    return db.cache.get(
+        SALES, store, lambda: db.range_totals(start, end, dim, key),
+        key=("period", start, end, dim, key, date.today()),
+    )
+
+# Measures a period comparison can show: label -> totals field
+PERIOD_MEASURES = {"Sold": "sold", "Acc": "acc", "Cash": "cash", "Card": "card", "Cost": "cost", "Sales": "count"}
+
+@profile.timed
+def load_product_totals(store, start, end):
+    # Line items summed per product by the columnar ledger (one bincount per
+    # measure); a new sale only appends its rows to the shared ledger
+    ledger = db.cache.get(SALES, None, db.load_ledger, key="ledger")
+    profile.gauge("ledger_sales", len(ledger))
+    return ledger.group_totals("product", ledger.mask(store=store, start=start, end=end))
+
+@profile.timed
+def load_bucket_totals(start, end, bucket, dim="store"):
+    # Day/week/month/year rollups of the daily summaries, plus today's live sales
+    return db.cache.get(
+        SALES, None, lambda: db.bucket_totals(start, end, bucket, dim),
+        key=("buckets", start, end, bucket, dim, date.today()),
+    )
+
+@profile.timed
+def load_day_close(store, day):
+    return db.cache.get(CLOSES, store, lambda: db.day_close(store, day), key=("close", day))
+
+@profile.timed
+def load_day_closes(store):
+    return db.cache.get(CLOSES, store, lambda: db.day_closes(store), key="recent")
+
+def close_store_day(store, day, closed_by):
+    db.close_day(store, day, closed_by)
+
+def watch_for_changes(*watched):
+    # Reruns the page when another register writes to one of the (topic, store)
+    # pairs it shows; needs st.fragment, so older Streamlit just skips it.
+    if not hasattr(st, "fragment"):
+        return
+    seen = [db.changes.version(topic, store) for topic, store in watched]
+
+    @st.fragment(run_every=5)
+    def poll():
+        if [db.changes.version(topic, store) for topic, store in watched] != seen:
+            st.rerun()
+
+    poll()
+
+SORT_OPTIONS = {"Date": "ts", "Employee": "employee", "Store": "store", "Sold": "sold", "Profit": "acc", "Cost": "cost"}
+
+@profile.timed
+def show_sales_table(key, store=None, employee=None, start=None, end=None):
+    # Server-side paging: only the visible page is queried, formatted and sent to the browser
+    if start is not None:
+        start, end = datetime.combine(start, datetime.min.time()), datetime.combine(end, datetime.min.time())
+    total_rows = db.count_sales(store, employee, start, end)
+    if not total_rows:
+        st.info("No sales records found.")
+        return
+
+    col1, col2, col3, col4 = st.columns([3, 2, 2, 2])
+    with col1:
+        sort_label = st.selectbox("Sort by", list(SORT_OPTIONS), key=f"{key}_sort")
+    with col2:
+        descending = st.checkbox("Newest / largest first", value=True, key=f"{key}_desc")
+    with col3:
+        page_size = st.selectbox("Rows per page", [25, 50, 100, 250], key=f"{key}_size")
+    pages = (total_rows + page_size - 1) // page_size
+    with col4:
+        page = st.number_input(f"Page (of {pages})", 1, pages, 1, key=f"{key}_page")
+
+    offset = (page - 1) * page_size
+    page_sales = db.query_sales(store, employee, start, end, order_by=SORT_OPTIONS[sort_label], descending=descending,
+                                limit=page_size, offset=offset)
+    profile.count("sales_loaded", len(page_sales))
+    st.caption(f"Showing {offset + 1}–{offset + len(page_sales)} of {total_rows} sales")
+    with profile.span("sale_rows"):
+        rows = list(sale_rows(Sale.from_dict(sale) for sale in page_sales))
+    st.table(rows)
+
+@profile.timed
+def pick_sale(key, label, start=None, end=None, page_size=50):
+    # Sidebar picker over one page of sales, newest first, so a rerun reads
+    # page_size sales rather than the whole history. Returns the chosen sale.
+    total_rows = db.count_sales(start=start, end=end)
+    if not total_rows:
+        return None
+    pages = (total_rows + page_size - 1) // page_size
+    # Deletes can leave the last page empty; fall back to the new last one
+    if st.session_state.get(f"{key}_page", 1) > pages:
+        st.session_state[f"{key}_page"] = pages
+    page = st.sidebar.number_input(f"Page (of {pages})", 1, pages, key=f"{key}_page")
+
+    offset = (page - 1) * page_size
+    page_sales = db.query_sales(start=start, end=end, descending=True, limit=page_size, offset=offset)
+    profile.count("sales_loaded", len(page_sales))
+    if not page_sales:
+        return None
+    sales = {sale["uid"]: sale for sale in page_sales}
+    labels = {
+        s["uid"]: f"{offset + i + 1}. {s['date']} | {s['employee']} | {s['store']} | {', '.join([p['name'] for p in s['products']])} | ${s['sold']}"
+        for i, s in enumerate(page_sales)
     }
+    # Choices are uids, so an edited sale stays selected; a deleted one starts over at the first
+    if st.session_state.get(key) not in sales:
+        st.session_state[key] = page_sales[0]["uid"]
+    return sales[st.sidebar.selectbox(label, list(sales), key=key, format_func=labels.get)]
 
+@profile.timed
 def show_totals(title, totals):
     st.write(
         f"**{title}** | Cost: ${totals['cost']:.2f} | Sold: ${totals['sold']:.2f} | "
         f"Acc: ${totals['acc']:.2f} | Cash: ${totals['cash']:.2f} | Card: ${totals['card']:.2f}"
     )
 
-# ---------- Streamlit App Setup ----------
-st.set_page_config(page_title="Total Wireless App", layout="wide")
-st.title("📱 Total Wireless Sales & Inventory App by PBarua")
-
-# ---------- Employee Login ----------
-st.sidebar.header("🔑 Login")
-employee = st.sidebar.text_input("Employee Name", "").strip()
-password = st.sidebar.text_input("Password", type="password")
-
-is_admin = employee in ADMIN_CREDENTIALS and password == ADMIN_CREDENTIALS.get(employee, "")
-
+# ---------- Menu ----------
 if not employee:
     st.sidebar.warning("Enter your name to continue")
     st.stop()
@@ -85,6 +438,7 @@ if not employee:
 st.sidebar.success(f"Logged in as {employee}")
 
 menu = st.sidebar.radio("Menu", ["Add Sale", "Inventory", "Reports"])
+profile.phase(f"menu: {menu}")
 
 # ---------- Add Sale ----------
 if menu == "Add Sale":
@@ -92,8 +446,8 @@ if menu == "Add Sale":
 
     store = st.selectbox("Select Store", STORE_LOCATIONS)
 
-    products_for_store = load_products().get(store, {})
-    inventory_for_store = load_inventory().get(store, {})
+    products_for_store = load_products(store)
+    inventory_for_store = load_register_stock(store)
 
     sale_type = st.radio("Sale Type", ["Phone Sale", "Bill Payment", "Custom Items + Phone"])
 
@@ -106,40 +460,65 @@ if menu == "Add Sale":
         payment_method = st.selectbox("Payment Method", ["Cash", "Card"])
 
         if st.button("💾 Save Sale"):
-            acc = sold - cost
-            sales = load_sales()
-            sales.append({
-                "employee": employee,
-                "store": store,
-                "date": datetime.now().strftime("%m/%d/%Y %H:%M"),
-                "type": sale_type,
-                "products": [{"name": product, "quantity": qty, "cost": cost, "sold": sold}],
-                "cost": cost,
-                "sold": sold,
-                "acc": acc,
-                "payment_method": payment_method
-            })
-            save_sales(sales)
+            sale = build_sale(employee, store, sale_type, [line_item(product, qty, cost, sold)], payment_method)
+            if register:
+                record_sale(sale)
+            else:
+                add_sale(sale)
             st.success("✅ Bill payment saved successfully!")
 
     else:
         # Phone Sale or Phone + Custom Items
-        st.write("Select products and quantities:")
+        st.write("Search for products and add them to the cart:")
+
+        # Cart holds only the chosen product names; widgets are drawn for those alone
+        cart = st.session_state.setdefault("cart", {}).setdefault(store, [])
+
+        query = st.text_input("Search Products", key=f"product_search_{store}")
+        if query.strip():
+            found = search_products(store, query, limit=25)
+            matches = [name for name in found if inventory_for_store.get(name, 0) > 0 and name not in cart][:10]
+            # Not sellable here: say which other stores have it. With nothing in
+            # stock here, the catalog-wide index also finds products this store
+            # has never carried.
+            elsewhere_names = [name for name in found if inventory_for_store.get(name, 0) <= 0]
+            if not matches:
+                elsewhere_names += [
+                    name for name in search_catalog(query)
+                    if inventory_for_store.get(name, 0) <= 0 and name not in elsewhere_names
+                ]
+            for name in elsewhere_names[:3]:
+                elsewhere = {s: q for s, q in load_availability(name).items() if s != store}
+                if elsewhere:
+                    st.caption(f"'{name}' is out of stock here; available at " + ", ".join(f"{s} ({q})" for s, q in elsewhere.items()))
+            if matches:
+                col1, col2 = st.columns([4, 1])
+                with col1:
+                    pick = st.selectbox(
+                        "Matching Products",
+                        matches,
+                        format_func=lambda name: f"{name} (Available: {inventory_for_store.get(name, 0)})",
+                        key=f"product_pick_{store}",
+                    )
+                with col2:
+                    st.button("➕ Add to Cart", key=f"add_to_cart_{store}", on_click=cart.append, args=(pick,))
+            else:
+                st.info("No in-stock products match that search.")
 
         products_selected = []
-        total_cost = 0.0
-        total_sold = 0.0
 
-        # Allow multiple products selection from inventory for that store
-        for product_name, product_cost in products_for_store.items():
+        for product_name in list(cart):
+            product_cost = products_for_store.get(product_name, 0.0)
             available_qty = inventory_for_store.get(product_name, 0)
-            if available_qty > 0:
-                qty = st.number_input(f"{product_name} (Available: {available_qty})", 0, available_qty, 0)
-                if qty > 0:
-                    sold_price = st.number_input(f"Sold Price for {product_name} (per unit)", 0.0, 100000.0, float(product_cost))
-                    products_selected.append({"name": product_name, "quantity": qty, "cost": product_cost * qty, "sold": sold_price * qty})
-                    total_cost += product_cost * qty
-                    total_sold += sold_price * qty
+            col1, col2, col3 = st.columns([4, 3, 1])
+            with col1:
+                qty = st.number_input(f"{product_name} (Available: {available_qty})", 0, max(available_qty, 1), min(1, available_qty), key=f"cart_qty_{store}_{product_name}")
+            with col2:
+                sold_price = st.number_input(f"Sold Price for {product_name} (per unit)", 0.0, 100000.0, float(product_cost), key=f"cart_price_{store}_{product_name}")
+            with col3:
+                st.button("🗑", key=f"cart_remove_{store}_{product_name}", on_click=cart.remove, args=(product_name,))
+            if qty > 0:
+                products_selected.append(line_item(product_name, qty, product_cost, sold_price))
 
         # Add custom product if sale_type == "Custom Items + Phone"
         if sale_type == "Custom Items + Phone":
@@ -150,60 +529,61 @@ if menu == "Add Sale":
             custom_sold = st.number_input("Custom Product Sold Price ($)", 0.0, 100000.0, 0.0)
 
             if custom_product_name.strip() and custom_qty > 0:
-                products_selected.append({
-                    "name": custom_product_name.strip(),
-                    "quantity": custom_qty,
-                    "cost": custom_cost * custom_qty,
-                    "sold": custom_sold * custom_qty
-                })
-                total_cost += custom_cost * custom_qty
-                total_sold += custom_sold * custom_qty
+                products_selected.append(line_item(custom_product_name.strip(), custom_qty, custom_cost, custom_sold))
 
         payment_method = st.selectbox("Payment Method", ["Cash", "Card"])
 
         if st.button("💾 Save Sale"):
+            sale = build_sale(employee, store, sale_type, products_selected, payment_method)
+            # Checked against the cached stock first; the checkout re-checks atomically
+            shortfalls = stock_shortfalls(store, inventory_for_store, sale.products)
             if not products_selected:
                 st.error("Select at least one product with quantity greater than zero.")
+            elif shortfalls:
+                for problem in shortfalls:
+                    st.error(str(problem))
             else:
-                # Check inventory for each product and reduce
-                inventory_ok = True
-                for item in products_selected:
-                    name = item["name"]
-                    qty = item["quantity"]
-                    if name != "Bill Payment":  # Bill payment no inventory change
-                        if not reduce_inventory(store, name, qty):
-                            inventory_ok = False
-                            break
-                if not inventory_ok:
-                    st.stop()
-
-                acc = total_sold - total_cost
-                sales = load_sales()
-                sales.append({
-                    "employee": employee,
-                    "store": store,
-                    "date": datetime.now().strftime("%m/%d/%Y %H:%M"),
-                    "type": sale_type,
-                    "products": products_selected,
-                    "cost": total_cost,
-                    "sold": total_sold,
-                    "acc": acc,
-                    "payment_method": payment_method
-                })
-                save_sales(sales)
-                st.success("✅ Sale saved successfully!")
+                sale_id = record_sale(sale)
+                if sale_id is not None:
+                    cart.clear()
+                    st.success("✅ Sale saved successfully!")
 
 # ---------- Inventory ----------
 elif menu == "Inventory":
     st.header("📦 Inventory Management")
 
     store = st.selectbox("Select Store", STORE_LOCATIONS, key="inv_store")
-    inventory = load_inventory()
-    products = load_products()
+    products = load_products(store)
+    outlook = load_stock_outlook(store)
+    watch_for_changes((INVENTORY, store), (PRODUCTS, store), (SALES, store))
+
+    alerts = low_stock(outlook)
+    if alerts:
+        st.subheader("⚠️ Low Stock")
+        st.caption(f"Selling out within {LEAD_DAYS} days at the recent rate; reorders cover {TARGET_DAYS} days of sales")
+        st.table([
+            {
+                "Product": row["product"],
+                "Quantity": row["qty"],
+                "Units / Day": f"{row['daily_units']:.1f}",
+                "Days of Cover": f"{row['days_of_cover']:.1f}",
+                "Suggested Reorder": row["reorder_qty"],
+            }
+            for row in alerts
+        ])
 
     st.subheader("Current Inventory")
-    if inventory.get(store):
-        inv_list = [{"Product": p, "Quantity": q, "Cost Price": products.get(store, {}).get(p, 0.0)} for p, q in inventory[store].items()]
+    if outlook:
+        inv_list = [
+            {
+                "Product": row["product"],
+                "Quantity": row["qty"],
+                "Cost Price": products.get(row["product"], 0.0),
+                "Units / Day": f"{row['daily_units']:.1f}",
+                "Days of Cover": "—" if row["days_of_cover"] is None else f"{row['days_of_cover']:.0f}",
+            }
+            for row in outlook
+        ]
         st.table(inv_list)
     else:
         st.info("No inventory found for this store.")
@@ -217,52 +597,148 @@ elif menu == "Inventory":
     if st.button("Update Inventory"):
         if new_product.strip():
             # Update inventory quantity
-            current_qty = inventory.get(store, {}).get(new_product.strip(), 0)
-            if store not in inventory:
-                inventory[store] = {}
-            inventory[store][new_product.strip()] = current_qty + qty_add
-            save_inventory(inventory)
+            new_qty = add_stock(store, new_product.strip(), qty_add)
 
             # Update product cost price
-            if store not in products:
-                products[store] = {}
-            products[store][new_product.strip()] = cost_price
-            save_products(products)
+            set_product_cost(store, new_product.strip(), cost_price)
 
-            st.success(f"✅ '{new_product}' updated. New quantity: {inventory[store][new_product.strip()]}, Cost Price: ${cost_price:.2f}")
+            st.success(f"✅ '{new_product}' updated. New quantity: {new_qty}, Cost Price: ${cost_price:.2f}")
         else:
             st.error("Enter a valid product name")
 
+    st.subheader("📥 Bulk Import")
+    st.caption("CSV or Excel file with columns: store, product, qty, cost (leave cost blank to keep the current one; new products need a cost)")
+
+    upload = st.file_uploader("Inventory File", type=["csv", "xlsx"], key="inv_bulk_upload")
+
+    if upload is not None and st.button("Import File"):
+        try:
+            result = parse_inventory(iter_upload_rows(upload, upload.name), STORE_LOCATIONS, priced_products())
+        except ImportError as e:
+            st.error(str(e))
+        else:
+            if not result.ok:
+                st.error("Nothing was imported. Fix these rows and upload the file again:")
+                st.table([{"Row": number, "Problem": message} for number, message in result.errors])
+            elif not result.items:
+                st.info("The file has no inventory rows.")
+            elif import_inventory(result.items):
+                st.success(f"✅ Imported {result.rows} rows covering {len(result.items)} products.")
+
+    st.subheader("🔁 Transfer Stock")
+    in_stock = [row["product"] for row in outlook if row["qty"] > 0]
+    if in_stock:
+        transfer_product = st.selectbox("Product", in_stock, key="transfer_product")
+        st.table([{"Store": s, "Quantity": q} for s, q in load_availability(transfer_product).items()])
+        col1, col2 = st.columns(2)
+        with col1:
+            transfer_to = st.selectbox("To Store", [s for s in STORE_LOCATIONS if s != store], key="transfer_to")
+        with col2:
+            transfer_qty = st.number_input("Quantity to Move", 1, 500, 1, key="transfer_qty")
+        if st.button("Transfer"):
+            moved = transfer_stock(transfer_product, store, transfer_to, transfer_qty, employee)
+            if moved is not None:
+                st.success(f"✅ Moved {transfer_qty} x '{transfer_product}' to {transfer_to}. Left here: {moved[0]}, now there: {moved[1]}")
+    else:
+        st.info("Nothing in stock here to transfer.")
+
+    transfers = load_transfers(store)
+    if transfers:
+        st.caption("Recent transfers")
+        st.table([
+            {"Date": t["moved_at"], "Product": t["product"], "From": t["from_store"], "To": t["to_store"], "Quantity": t["qty"], "By": t["moved_by"]}
+            for t in transfers
+        ])
+
 # ---------- Reports ----------
 elif menu == "Reports":
     st.header("📊 Sales Reports")
 
-    sales = load_sales()
-    if not sales:
+    if not load_totals()["count"]:
         st.info("No sales data available.")
         st.stop()
 
-    report_type = st.radio("Report Type", ["All Stores", "By Store", "By Employee"])
+    report_type = st.radio(
+        "Report Type", ["All Stores", "By Store", "By Employee", "By Product", "Period Comparison", "End of Day Close"]
+    )
+    period = st.date_input("Period (leave empty for all time)", value=(), key="report_period")
+    if len(period) == 2:
+        start, end = period[0], period[1] + timedelta(days=1)
+    else:
+        start = end = None
 
     if report_type == "All Stores":
-        totals = calculate_totals(sales)
+        totals = load_period_totals(start, end)
         show_totals("ALL STORES", totals)
-        st.table(format_sales_for_display(sales))
+        show_sales_table("report_all", start=start, end=end)
+        watch_for_changes((SALES, None))
 
     elif report_type == "By Store":
         store = st.selectbox("Select Store", STORE_LOCATIONS)
-        filtered = [s for s in sales if s["store"] == store]
-        totals = calculate_totals(filtered)
+        totals = load_period_totals(start, end, "store", store)
         show_totals(store, totals)
-        st.table(format_sales_for_display(filtered))
+        show_sales_table("report_store", store=store, start=start, end=end)
+        watch_for_changes((SALES, store))
 
     elif report_type == "By Employee":
-        employees = list(set(s["employee"] for s in sales))
+        employees = list_employees()
         emp = st.selectbox("Select Employee", employees)
-        filtered = [s for s in sales if s["employee"] == emp]
-        totals = calculate_totals(filtered)
+        totals = load_period_totals(start, end, "employee", emp)
         show_totals(emp, totals)
-        st.table(format_sales_for_display(filtered))
+        show_sales_table("report_employee", employee=emp, start=start, end=end)
+        watch_for_changes((SALES, None))
+
+    elif report_type == "By Product":
+        store = st.selectbox("Select Store", ["All"] + STORE_LOCATIONS, key="product_report_store")
+        store = None if store == "All" else store
+        groups = load_product_totals(store, start, end)
+        if groups:
+            st.table(list(product_rows(groups)))
+        else:
+            st.info("No sales in this period.")
+        watch_for_changes((SALES, store))
+
+    elif report_type == "Period Comparison":
+        col1, col2 = st.columns(2)
+        with col1:
+            bucket = st.selectbox("Group by", ["Day", "Week", "Month", "Year"], index=2, key="report_bucket")
+        with col2:
+            measure = st.selectbox("Show", list(PERIOD_MEASURES), key="report_measure")
+        if start is None:
+            start, end = date.today() - timedelta(days=365), date.today() + timedelta(days=1)
+            st.caption("Showing the last 365 days; pick a period above to change it.")
+        buckets = load_bucket_totals(start, end, bucket.lower())
+        if buckets:
+            st.table(list(period_rows(buckets, PERIOD_MEASURES[measure], STORE_LOCATIONS)))
+        else:
+            st.info("No sales in this period.")
+        watch_for_changes((SALES, None))
+
+    elif report_type == "End of Day Close":
+        store = st.selectbox("Select Store", STORE_LOCATIONS, key="close_store")
+        close_date = st.date_input("Day", value=date.today(), max_value=date.today(), key="close_date")
+        live = load_period_totals(close_date, close_date + timedelta(days=1), "store", store)
+        closed = load_day_close(store, close_date)
+        if closed:
+            show_totals(f"{store} {close_date:%m/%d/%Y} closed by {closed['closed_by']} at {closed['closed_at']}", closed)
+            if live["count"] != closed["count"] or abs(live["sold"] - closed["sold"]) >= 0.005:
+                st.warning("Sales for this day changed after it was closed.")
+                show_totals("Now", live)
+        else:
+            show_totals(f"{store} {close_date:%m/%d/%Y} (open)", live)
+            st.button("🔒 Close Day", on_click=close_store_day, args=(store, close_date, employee))
+
+        closes = load_day_closes(store)
+        if closes:
+            st.subheader("Recent Closes")
+            st.table([
+                {
+                    "Day": c["day"], "Sales": c["count"], "Cash": f"${c['cash']:.2f}", "Card": f"${c['card']:.2f}",
+                    "Sold": f"${c['sold']:.2f}", "Closed By": c["closed_by"], "Closed At": c["closed_at"],
+                }
+                for c in closes
+            ])
+        watch_for_changes((SALES, store), (CLOSES, store))
 
 # ---------- Admin Panel ----------
 if is_admin:
@@ -272,40 +748,58 @@ if is_admin:
         [
             "None",
             "View All Sales",
+            "Export Sales",
             "Delete All Sales",
             "Delete All Inventory",
             "Delete Specific Sale",
             "Modify Sale Record",
-            "Manage Products"
+            "Manage Products",
+            "Diagnostics",
+            *(["Register Sync"] if register else []),
         ]
     )
-
-    # Helper to format sales with multiple products nicely
-    def format_sales_for_display(sales_list):
-        display_list = []
-        for sale in sales_list:
-            products_desc = ", ".join([f"{p['name']} (x{p['quantity']})" for p in sale.get("products", [])])
-            display_list.append({
-                "Employee": sale["employee"],
-                "Store": sale["store"],
-                "Date": sale["date"],
-                "Type": sale["type"],
-                "Products": products_desc,
-                "Cost": sale["cost"],
-                "Sold": sale["sold"],
-                "Profit": sale["acc"],
-                "Payment": sale["payment_method"],
-            })
-        return display_list
+    profile.phase(f"admin: {admin_action}")
 
     # View All Sales
     if admin_action == "View All Sales":
         st.subheader("📄 All Sales Records (Admin View)")
-        sales = load_sales()
-        if sales:
-            st.table(format_sales_for_display(sales))
-        else:
-            st.info("No sales records found.")
+        col1, col2 = st.columns(2)
+        with col1:
+            view_store = st.selectbox("Store", ["All"] + STORE_LOCATIONS, key="admin_view_store")
+        with col2:
+            view_employee = st.selectbox("Employee", ["All"] + list_employees(), key="admin_view_employee")
+        show_sales_table(
+            "admin_view",
+            store=None if view_store == "All" else view_store,
+            employee=None if view_employee == "All" else view_employee,
+        )
+
+    # Export Sales
+    elif admin_action == "Export Sales":
+        st.subheader("📤 Export Sales (CSV)")
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            export_store = st.selectbox("Store", ["All"] + STORE_LOCATIONS, key="export_store")
+        with col2:
+            export_employee = st.selectbox("Employee", ["All"] + list_employees(), key="export_employee")
+        with col3:
+            export_from = st.date_input("From", value=None, key="export_from")
+        with col4:
+            export_to = st.date_input("To (inclusive)", value=None, key="export_to")
+
+        if st.button("Prepare Export"):
+            # Rows stream from the database in batches straight into CSV text;
+            # no sale dicts are built, only the finished file is buffered for download
+            export_file = io.BytesIO()
+            chunks = iter_sales_csv(db.iter_sale_lines(
+                store=None if export_store == "All" else export_store,
+                employee=None if export_employee == "All" else export_employee,
+                start=datetime.combine(export_from, datetime.min.time()) if export_from else None,
+                end=datetime.combine(export_to + timedelta(days=1), datetime.min.time()) if export_to else None,
+            ))
+            for chunk in chunks:
+                export_file.write(chunk.encode("utf-8"))
+            st.download_button("⬇️ Download CSV", export_file, file_name="sales_export.csv", mime="text/csv")
 
     # Delete All Sales
     elif admin_action == "Delete All Sales":
@@ -313,7 +807,7 @@ if is_admin:
             if st.form_submit_button("⚠️ Reset All Sales Data"):
                 save_sales([])
                 st.sidebar.success("✅ All sales data has been reset!")
-                st.experimental_rerun()
+                st.rerun()
 
     # Delete All Inventory
     elif admin_action == "Delete All Inventory":
@@ -322,61 +816,35 @@ if is_admin:
                 save_inventory({store: {} for store in STORE_LOCATIONS})
                 save_products({store: {} for store in STORE_LOCATIONS})
                 st.sidebar.success("✅ All inventory and products have been reset!")
-                st.experimental_rerun()
+                st.rerun()
 
     # Delete Specific Sale
     elif admin_action == "Delete Specific Sale":
-        sales = load_sales()
-        if sales:
-            options = [
-                f"{i+1}. {s['date']} | {s['employee']} | {s['store']} | {', '.join([p['name'] for p in s['products']])} | ${s['sold']}"
-                for i, s in enumerate(sales)
-            ]
-            if 'selected_sale_to_delete' not in st.session_state:
-                st.session_state.selected_sale_to_delete = options[0]
-            choice = st.sidebar.selectbox("Select Sale to Delete", options, key="sale_delete_select", index=options.index(st.session_state.selected_sale_to_delete))
-            st.session_state.selected_sale_to_delete = choice
-            index = options.index(choice)
-
+        sale = pick_sale("sale_delete_select", "Select Sale to Delete")
+        if sale is not None:
             with st.sidebar.form(key="delete_specific_sale_form"):
                 if st.form_submit_button("🗑 Delete Selected Sale"):
-                    del sales[index]
-                    save_sales(sales)
+                    delete_sale(sale["uid"])
                     st.sidebar.success("✅ Sale deleted successfully!")
-                    st.experimental_rerun()
+                    st.rerun()
         else:
             st.sidebar.info("No sales records to delete.")
 
     # Modify Sale Record
     elif admin_action == "Modify Sale Record":
-        sales = load_sales()
-        if sales:
+        if load_totals()["count"]:
             show_all = st.sidebar.checkbox("Show all sales (not just today)", value=False)
 
+            start = end = None
             if not show_all:
-                today_str = datetime.now().strftime("%m/%d/%Y")
-                filtered_sales = [s for s in sales if s["date"].startswith(today_str)]
-            else:
-                filtered_sales = sales
+                start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+                end = start + timedelta(days=1)
 
-            if not filtered_sales:
+            selected_sale = pick_sale("sale_modify_select", "Select Sale to Modify", start, end)
+            if selected_sale is None:
                 st.info("No sales records found for the selected filter.")
                 st.stop()
 
-            options = [
-                f"{i+1}. {s['date']} | {s['employee']} | {s['store']} | {', '.join([p['name'] for p in s['products']])} | ${s['sold']}"
-                for i, s in enumerate(filtered_sales)
-            ]
-
-            if 'selected_sale_to_modify' not in st.session_state or st.session_state.get('last_sales_count', 0) != len(filtered_sales):
-                st.session_state.selected_sale_to_modify = options[0]
-                st.session_state.last_sales_count = len(filtered_sales)
-
-            choice = st.sidebar.selectbox("Select Sale to Modify", options, key="sale_modify_select", index=options.index(st.session_state.selected_sale_to_modify))
-            st.session_state.selected_sale_to_modify = choice
-            index = options.index(choice)
-            selected_sale = filtered_sales[index]
-
             st.subheader("✏️ Modify Sale Record")
 
             new_employee = st.text_input("Employee", value=selected_sale["employee"])
@@ -396,7 +864,7 @@ if is_admin:
                 with col4:
                     sold = st.number_input(f"Sold Price (total) #{i+1}", min_value=0.0, max_value=1000000.0, value=prod["sold"], key=f"prod_sold_{i}")
 
-                edited_products.append({"name": name.strip(), "quantity": qty, "cost": cost, "sold": sold})
+                edited_products.append(LineItem(name.strip(), qty, cost, sold))
 
             # Option to add a new product
             if st.checkbox("Add New Product to this Sale"):
@@ -406,17 +874,13 @@ if is_admin:
                 new_prod_sold = st.number_input("New Product Sold Price (total)", min_value=0.0, max_value=1000000.0, value=0.0, key="new_prod_sold")
 
                 if new_prod_name.strip() != "":
-                    edited_products.append({
-                        "name": new_prod_name.strip(),
-                        "quantity": new_prod_qty,
-                        "cost": new_prod_cost,
-                        "sold": new_prod_sold
-                    })
+                    edited_products.append(LineItem(new_prod_name.strip(), new_prod_qty, new_prod_cost, new_prod_sold))
 
             new_payment = st.selectbox(
                 "Payment Method",
                 ["Cash", "Card"],
-                index=0 if selected_sale["payment_method"] == "Cash" else 1
+                index=0 if selected_sale["payment_method"] == "Cash" else 1,
+                key="modify_payment_method"
             )
 
             # Parse existing date/time string into datetime object
@@ -428,41 +892,22 @@ if is_admin:
             new_date = st.date_input("Sale Date", dt.date())
             new_time = st.time_input("Sale Time", dt.time())
 
-            combined_datetime = datetime.combine(new_date, new_time).strftime("%m/%d/%Y %H:%M")
+            combined_datetime = datetime.combine(new_date, new_time)
 
             if st.button("💾 Save Changes"):
-                # Validate
-                valid = True
-                for p in edited_products:
-                    if p["quantity"] < 1:
-                        st.error(f"Quantity for product '{p['name']}' must be at least 1.")
-                        valid = False
-                    if p["cost"] < 0 or p["sold"] < 0:
-                        st.error(f"Cost and Sold price must be non-negative for product '{p['name']}'.")
-                        valid = False
-
-                if not valid:
+                edited_sale = build_sale(
+                    new_employee.strip(), new_store, selected_sale["type"], edited_products, new_payment,
+                    when=combined_datetime,
+                )
+                problems = sale_problems(edited_sale)
+                for problem in problems:
+                    st.error(problem)
+                if problems:
                     st.stop()
 
-                total_cost = sum(p["cost"] for p in edited_products)
-                total_sold = sum(p["sold"] for p in edited_products)
-
-                sales_list = load_sales()
-                orig_index = sales_list.index(selected_sale)
-                sales_list[orig_index] = {
-                    "employee": new_employee.strip(),
-                    "store": new_store,
-                    "date": combined_datetime,
-                    "type": selected_sale["type"],
-                    "products": edited_products,
-                    "cost": total_cost,
-                    "sold": total_sold,
-                    "acc": total_sold - total_cost,
-                    "payment_method": new_payment
-                }
-                save_sales(sales_list)
+                update_sale(selected_sale["uid"], edited_sale)
                 st.success("✅ Sale record updated successfully!")
-                st.experimental_rerun()
+                st.rerun()
 
         else:
             st.info("No sales records to modify.")
@@ -471,38 +916,35 @@ if is_admin:
     elif admin_action == "Manage Products":
         st.subheader("🛠️ Manage Products")
 
-        products = load_products()
-
         store = st.selectbox("Select Store", STORE_LOCATIONS, key="product_manage_store")
 
-        store_products = products.get(store, {})
+        store_products = load_products(store)
+
+        result = st.session_state.pop("product_edit_result", None)
+        if result:
+            getattr(st, result[0])(result[1])
 
         if store_products:
             st.write(f"Current products and cost prices in {store}:")
-            for p_name, p_cost in store_products.items():
-                col1, col2, col3 = st.columns([5, 3, 2])
-                with col1:
-                    new_name = st.text_input(f"Product Name ({p_name})", value=p_name, key=f"prod_name_edit_{p_name}")
-                with col2:
-                    new_cost = st.number_input(f"Cost Price ($) for {p_name}", min_value=0.0, max_value=1000000.0, value=p_cost, key=f"prod_cost_edit_{p_name}")
-                with col3:
-                    if st.button(f"Delete {p_name}", key=f"delete_prod_{p_name}"):
-                        del products[store][p_name]
-                        save_products(products)
-                        st.experimental_rerun()
-
-                # Rename product if changed
-                if new_name.strip() != p_name:
-                    # Rename key safely
-                    products[store][new_name.strip()] = products[store].pop(p_name)
-                    save_products(products)
-                    st.experimental_rerun()
-
-                # Update cost price if changed
-                if products[store][new_name.strip()] != new_cost:
-                    products[store][new_name.strip()] = new_cost
-                    save_products(products)
-                    st.experimental_rerun()
+            st.caption("Costs and deletes apply to this store only. A rename applies to every store and to past sales.")
+            # Edits collect in the grid until Save; the key changes with the
+            # catalog version, so a grid never applies edits to a newer catalog
+            editor_key = f"product_editor_{store}_{db.changes.version(PRODUCTS, store)}"
+            with st.form(key="product_editor_form"):
+                st.data_editor(
+                    [{"Product": name, "Cost": cost, "Delete": False} for name, cost in store_products.items()],
+                    column_config={
+                        "Product": st.column_config.TextColumn("Product Name", required=True),
+                        "Cost": st.column_config.NumberColumn("Cost Price ($)", min_value=0.0, max_value=1000000.0, format="$%.2f", required=True),
+                        "Delete": st.column_config.CheckboxColumn("Delete"),
+                    },
+                    hide_index=True,
+                    key=editor_key,
+                )
+                st.checkbox("Rename in every store", key="confirm_shared_rename")
+                st.form_submit_button(
+                    "Save Changes", on_click=save_product_edits, args=(store, store_products, editor_key)
+                )
         else:
             st.info("No products found for this store.")
 
@@ -515,13 +957,75 @@ if is_admin:
         if st.button("Add Product"):
             if new_prod_name.strip() == "":
                 st.error("Product name cannot be empty.")
-            elif new_prod_name.strip() in products.get(store, {}):
+            elif new_prod_name.strip() in store_products:
                 st.error("Product already exists.")
             else:
-                if store not in products:
-                    products[store] = {}
-                products[store][new_prod_name.strip()] = new_prod_cost
-                save_products(products)
+                set_product_cost(store, new_prod_name.strip(), new_prod_cost)
                 st.success(f"Product '{new_prod_name.strip()}' added with cost price ${new_prod_cost:.2f}")
-                st.experimental_rerun()
-
+                st.rerun()
+
+    # Diagnostics
+    elif admin_action == "Diagnostics":
+        st.subheader("🩺 Diagnostics")
+        last = st.session_state.get("last_rerun_profile")
+        if last is not None:
+            st.write(
+                f"**Last rerun:** {last.seconds * 1000:.1f} ms | "
+                f"Widgets: {last.gauges.get('rerun_widgets', 'n/a')} | "
+                f"Sales loaded: {last.counts.get('sales_loaded', 0)} | "
+                f"Session state: {last.gauges.get('session_state_bytes', 0) / 1024:.1f} KiB"
+            )
+            st.table([
+                {"Span": name, "Calls": calls, "Time (ms)": f"{seconds * 1000:.2f}"}
+                for name, (calls, seconds) in last.span_totals().items()
+            ])
+
+        snapshot = metrics.snapshot()
+        st.write(
+            f"**Since start:** {snapshot['reruns']} reruns | "
+            f"avg {snapshot['rerun_seconds'] * 1000 / max(snapshot['reruns'], 1):.1f} ms | "
+            f"max {snapshot['rerun_seconds_max'] * 1000:.1f} ms"
+        )
+        spans = sorted(snapshot["spans"].items(), key=lambda item: -item[1]["seconds"])
+        st.table([
+            {
+                "Span": name, "Calls": span["calls"],
+                "Avg (ms)": f"{span['seconds'] * 1000 / span['calls']:.2f}",
+                "Max (ms)": f"{span['max_seconds'] * 1000:.2f}",
+                "Total (ms)": f"{span['seconds'] * 1000:.1f}",
+            }
+            for name, span in spans
+        ])
+        col1, col2 = st.columns(2)
+        with col1:
+            st.download_button("⬇️ Prometheus metrics", metrics.to_prometheus(), file_name="metrics.prom", mime="text/plain")
+        with col2:
+            st.download_button("⬇️ JSON metrics", metrics.to_json(), file_name="metrics.json", mime="application/json")
+
+    # Register Sync
+    elif admin_action == "Register Sync":
+        st.subheader("🔄 Register Sync")
+        status = register.status()
+        last_sync = status["last_sync"].strftime("%H:%M:%S") if status["last_sync"] else "never"
+        st.write(f"**Queued sales:** {status['pending']} | **Conflicts:** {status['conflicts']} | **Last sync:** {last_sync}")
+        if status["last_error"]:
+            st.warning(f"Central store unreachable: {status['last_error']}")
+        if st.button("Sync Now"):
+            if register.sync():
+                st.success("✅ Queue synced.")
+            else:
+                st.error(f"Sync failed: {register.last_error}")
+
+        for conflict in register.conflicts():
+            sale = conflict["sale"]
+            lines = ", ".join(f"{p['name']} (x{p['quantity']})" for p in sale["products"])
+            st.write(f"**{sale['date']}** {sale['store']} by {sale['employee']}: {lines}, ${sale['sold']:.2f}")
+            st.caption(f"Oversold: {conflict['reason']}")
+            col1, col2 = st.columns(2)
+            with col1:
+                st.button("Record Sale", key=f"conflict_record_{conflict['uid']}", on_click=register.resolve, args=(conflict["uid"], True))
+            with col2:
+                st.button("Discard", key=f"conflict_discard_{conflict['uid']}", on_click=register.resolve, args=(conflict["uid"], False))
+
+# ---------- Diagnostics ----------
+finish_profile()